@@ -0,0 +1,137 @@
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterator, List, Optional
+
+from src.channellog import ChannelLog
+from src.commandregistry import CommandRegistry
+from src.ratelimit import CommandLimiter
+from src.sentiment import SentimentService
+from src.triggermatcher import TriggerMatcher
+from src.userstore.userindex import UserIndex
+from src.userstore.userstore import UserStore
+from src.wordcloudrenderer import WordCloudRenderer
+from src.wordindex import WordFrequencyIndex
+
+if TYPE_CHECKING:
+    from src.ircbot import IRCBot
+
+log = logging.getLogger(__name__)
+
+# Files of the single channel layout, moved to the first channel's directory
+LEGACY_STORAGE_FILES = ['users.sqlite3', 'users.sqlite3-wal',
+                        'users.sqlite3-shm', 'users.json', 'archive']
+
+
+def move_legacy_storage(storage_dir: str, channel_dir: str) -> None:
+    """
+    Move the storage of a bot from before multi-channel support into the
+    directory of its channel, once.
+    """
+    if os.path.exists(channel_dir):
+        return
+    os.makedirs(channel_dir)
+    for filename in LEGACY_STORAGE_FILES:
+        path = os.path.join(storage_dir, filename)
+        if os.path.exists(path):
+            os.replace(path, os.path.join(channel_dir, filename))
+            log.info("Moved %s to %s", path, channel_dir)
+
+
+class Channel:
+    """
+    The state the bot keeps per joined channel: users, message log, rate
+    limits, triggers and the line length, which depends on the channel
+    name. The commands of a channel get it as their receiver, the engines
+    shared by all channels are reached through the bot.
+    """
+    __slots__ = ('_bot', 'name', 'user_db', 'user_index', 'word_index',
+                 'channel_log', 'command_limiter', 'commands',
+                 'trigger_matcher', 'max_message_length', 'join_time',
+                 'ignoring_messages')
+
+    def __init__(self, bot: 'IRCBot', name: str, user_db: UserStore,
+                 word_index: WordFrequencyIndex, channel_log: ChannelLog,
+                 command_limiter: CommandLimiter,
+                 commands: CommandRegistry) -> None:
+        self._bot = bot
+        self.name = name
+        self.user_db = user_db
+        self.user_index = UserIndex(user_db.names())
+        self.word_index = word_index
+        self.channel_log = channel_log
+        self.command_limiter = command_limiter
+        self.commands = commands
+        # The channel's own table if it has one, else the bot's
+        self.trigger_matcher = TriggerMatcher({})
+        self.max_message_length = 0  # Set on join
+        self.join_time = 0.0
+        self.ignoring_messages = True
+
+    def add_message(self, name: str, message: str) -> None:
+        timestamp = time.time()
+        with self.word_index.lock:
+            self.user_db.add_message(name, message, timestamp)
+            self.word_index.add_message(name, message)
+        self.user_index.add(name)
+        self.channel_log.append(name, message, timestamp)
+
+    def iter_user_messages(self, name: str) -> Iterator[str]:
+        """
+        All kept messages of a user oldest first, archived ones included,
+        streamed instead of loaded at once.
+        """
+        return self.user_db.iter_messages(name)
+
+    def find_user(self, name_query: str, prefix: bool = True,
+                  fuzzy: bool = False) -> Optional[Dict]:
+        name = self.user_index.find(name_query, prefix=prefix, fuzzy=fuzzy)
+        if name is None:
+            return None
+        return self.user_db.get(name)
+
+    def close(self) -> None:
+        self.user_db.close()
+        self.channel_log.close()
+
+    # Read by the commands
+
+    @property
+    def channel(self) -> str:
+        return self.name
+
+    @property
+    def triggers(self) -> Dict[str, List]:
+        return self.trigger_matcher.triggers
+
+    @property
+    def user_db_history_size(self) -> int:
+        return self.user_db.history_size
+
+    @property
+    def admin_name(self) -> str:
+        return self._bot.admin_name
+
+    @property
+    def command_prefix(self) -> str:
+        return self._bot.command_prefix
+
+    @property
+    def command_stopwords(self) -> FrozenSet[str]:
+        return self._bot.command_stopwords
+
+    @property
+    def creation_time(self) -> float:
+        return self._bot.creation_time
+
+    @property
+    def version(self) -> str:
+        return self._bot.version
+
+    @property
+    def sentiment_service(self) -> SentimentService:
+        return self._bot.sentiment_service
+
+    @property
+    def wordcloud_renderer(self) -> WordCloudRenderer:
+        return self._bot.wordcloud_renderer
@@ -0,0 +1,164 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import BinaryIO, Callable, Iterator, List, NamedTuple, Optional
+
+# Index entry: timestamp, offset of the line in the data file
+ENTRY = struct.Struct('<dQ')
+
+
+class LogEntry(NamedTuple):
+    timestamp: float
+    nick: str
+    message: str
+
+
+class ChannelLog:
+    """
+    Append-only log of the messages of a channel, in segments of
+    segment_seconds. A segment is a data file of nick<TAB>message lines
+    and an index file of fixed size (timestamp, offset) entries. Both are
+    memory-mapped when read, the start of a time range is found by binary
+    search over the index. At most max_segments are kept.
+    """
+
+    def __init__(self, directory: str, segment_seconds: int,
+                 max_segments: int,
+                 clock: Callable[[], float] = time.time) -> None:
+        self._directory = directory
+        self._segment_seconds = segment_seconds
+        self._max_segments = max_segments
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Segment being appended to
+        self._segment_start: Optional[int] = None
+        self._data: Optional[BinaryIO] = None
+        self._index: Optional[BinaryIO] = None
+        self._offset = 0
+        os.makedirs(directory, exist_ok=True)
+        # Go on from the newest entry of an earlier run, else a clock that
+        # is behind after a restart would unsort the index
+        self._last_timestamp = self._newest_timestamp()
+
+    def _path(self, segment_start: int, extension: str) -> str:
+        return os.path.join(self._directory,
+                            f'{segment_start:012d}.{extension}')
+
+    def _segment_starts(self) -> List[int]:
+        return sorted(int(f[:-4]) for f in os.listdir(self._directory)
+                      if f.endswith('.idx'))
+
+    def _newest_timestamp(self) -> float:
+        for segment_start in reversed(self._segment_starts()):
+            with open(self._path(segment_start, 'idx'), 'rb') as index:
+                # A partial entry at the end is ignored
+                count = os.fstat(index.fileno()).st_size // ENTRY.size
+                if count:
+                    index.seek((count - 1) * ENTRY.size)
+                    return ENTRY.unpack(index.read(ENTRY.size))[0]
+        return 0.0
+
+    def append(self, nick: str, message: str,
+               timestamp: Optional[float] = None) -> None:
+        if timestamp is None:
+            timestamp = self._clock()
+        line = f'{nick}\t{message}\n'.encode()
+        with self._lock:
+            # The index has to stay sorted even if the clock jumps back
+            timestamp = max(timestamp, self._last_timestamp)
+            self._last_timestamp = timestamp
+            segment_start = int(timestamp // self._segment_seconds *
+                                self._segment_seconds)
+            if segment_start != self._segment_start:
+                self._open_segment(segment_start)
+            assert self._data is not None and self._index is not None
+            # Data first, an index entry never points past the data
+            self._data.write(line)
+            self._data.flush()
+            self._index.write(ENTRY.pack(timestamp, self._offset))
+            self._index.flush()
+            self._offset += len(line)
+
+    def _open_segment(self, segment_start: int) -> None:
+        self._close_segment()
+        self._segment_start = segment_start
+        self._data = open(self._path(segment_start, 'log'), 'ab')
+        self._index = open(self._path(segment_start, 'idx'), 'ab')
+        # Cut off a partial entry of an earlier crash
+        size = self._index.tell()
+        if size % ENTRY.size:
+            self._index.truncate(size - size % ENTRY.size)
+            self._index.seek(0, os.SEEK_END)
+        self._offset = self._data.tell()
+
+        for old_start in self._segment_starts()[:-self._max_segments]:
+            for extension in ('idx', 'log'):
+                os.remove(self._path(old_start, extension))
+
+    def _close_segment(self) -> None:
+        for f in (self._data, self._index):
+            if f is not None:
+                f.close()
+        self._data = self._index = None
+
+    def entries(self, start: float, end: float = math.inf) \
+            -> Iterator[LogEntry]:
+        """
+        Messages from start up to end oldest first, read one segment at
+        a time.
+        """
+        starts = self._segment_starts()
+        # A segment ends where the next one starts
+        for segment_start, next_start in zip(starts, starts[1:] + [None]):
+            if next_start is not None and next_start <= start:
+                continue
+            if segment_start >= end:
+                break
+            yield from self._read_segment(segment_start, start, end)
+
+    def _read_segment(self, segment_start: int, start: float,
+                      end: float) -> Iterator[LogEntry]:
+        try:
+            index_file = open(self._path(segment_start, 'idx'), 'rb')
+            data_file = open(self._path(segment_start, 'log'), 'rb')
+        except FileNotFoundError:
+            # Expired meanwhile
+            return
+        with index_file, data_file:
+            count = os.fstat(index_file.fileno()).st_size // ENTRY.size
+            if not count:
+                return
+            with mmap.mmap(index_file.fileno(), count * ENTRY.size,
+                           access=mmap.ACCESS_READ) as index, \
+                    mmap.mmap(data_file.fileno(), 0,
+                              access=mmap.ACCESS_READ) as data:
+                i = self._find(index, count, start)
+                while i < count:
+                    timestamp, offset = ENTRY.unpack_from(index,
+                                                          i * ENTRY.size)
+                    if timestamp >= end:
+                        break
+                    line = data[offset:data.find(b'\n', offset)].decode()
+                    nick, _, message = line.partition('\t')
+                    yield LogEntry(timestamp, nick, message)
+                    i += 1
+
+    @staticmethod
+    def _find(index: mmap.mmap, count: int, timestamp: float) -> int:
+        # First entry at or after timestamp
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ENTRY.unpack_from(index, mid * ENTRY.size)[0] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+            self._segment_start = None
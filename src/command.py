@@ -1,28 +1,22 @@
 import calendar
+import collections
 import datetime
-import os
-import re
+import logging
 import time
 from abc import ABC, abstractmethod
-from pathlib import Path
-from typing import List, Tuple, Union
-
-import copypasta_search as cps
-import matplotlib.pyplot as plt
-import numpy as np
-from PIL import Image
-from sklearn.feature_extraction.text import CountVectorizer
-from textblob import TextBlob
-from tinydb import Query
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from wordcloud import WordCloud, ImageColorGenerator
-
-from src.imageuploader import upload
+from typing import Dict, List, Optional, Tuple, Type, Union
+
 from src.sender.sender import Sender
-from src.util import STOPWORDS
+from src.util import Stopwords
+from src.wordindex import tokenize
+from src.wordcloudrenderer import JOB_CACHED, JOB_DUPLICATE, JOB_STARTED, \
+    find_mask
 
 
 class Command(ABC):
+    # Tokens taken from the rate limits of the user and the command
+    cost = 1.0
+
     # Receiver = Invoker
     def __init__(self, receiver, sender: Sender) -> None:
         self._receiver = receiver
@@ -50,6 +44,18 @@ class Command(ABC):
             return False
         return query
 
+    @staticmethod
+    def check_hours_arg(incoming_message: str, default: int,
+                        max_hours: int) -> Optional[int]:
+        query = Command.check_arg(incoming_message)
+        if not query:
+            return default
+        try:
+            hours = int(str(query))
+        except ValueError:
+            return None
+        return hours if 0 < hours <= max_hours else None
+
 
 class HelpCommand(Command):
 
@@ -67,6 +73,7 @@ class HelpCommand(Command):
 
 
 class CommandCommand(Command):
+    cost = 3.0
 
     @property
     def help_text(self) -> str:
@@ -88,7 +95,6 @@ class CommandCommand(Command):
                 self._sender.send_privmsg(msg, args[0],
                                           self._receiver.max_message_length,
                                           notice=True)
-                time.sleep(self._receiver.repeated_message_sleep_time / 10)
         else:
             command_names = ""
             for name in self._receiver.commands:
@@ -136,15 +142,13 @@ class LmCommand(Command):
                                       self._receiver.max_message_length)
             return False
 
-        user_q = Query()
-        user_q_res = self._receiver.user_db.search(
-            user_q.name.matches(name_query, flags=re.IGNORECASE))
+        user = self._receiver.find_user(name_query)
 
-        if user_q_res:
-            lm = user_q_res[0]['lastmessage']
-            ls = user_q_res[0]['lastseen']
+        if user:
+            lm = user['lastmessage']
+            ls = user['lastseen']
             msg = ("{0}\'s last message: \"{1}\" at {2}. "
-                   ).format(user_q_res[0]['name'], lm, ls)
+                   ).format(user['name'], lm, ls)
             self._sender.send_privmsg(msg, self._receiver.channel,
                                       self._receiver.max_message_length)
         else:
@@ -157,10 +161,11 @@ class LmCommand(Command):
 
 
 class SentimentCommand(Command):
+    cost = 2.0
 
     @property
     def help_text(self) -> str:
-        return "<text>/<user> analyze sentiment"
+        return "<text>/<user> [n] analyze sentiment (of a user's last n messages)"
 
     def execute(self, args: List[str]) -> bool:
         incoming_message = args[1]
@@ -171,22 +176,65 @@ class SentimentCommand(Command):
                                       self._receiver.max_message_length)
             return False
 
+        # Average over the last n messages of a user
+        query_parts = name_query.split()
+        if len(query_parts) == 2 and query_parts[1].isdigit():
+            # Only an exact nick, "hi 2" is text even if there is a hilda
+            user = self._receiver.find_user(query_parts[0], prefix=False)
+            if user:
+                n = int(query_parts[1])
+                if n < 1:
+                    self._sender.send_privmsg(
+                        "I need a number of messages from 1 on.",
+                        self._receiver.channel,
+                        self._receiver.max_message_length)
+                    return False
+                return self.execute_batch(user, n)
+
         # Use last message of user if argument is user name,
         # and that name is in the user log
-        user_q = Query()
-        user_q_res = self._receiver.user_db.search(
-            user_q.name.matches(name_query, flags=re.IGNORECASE))
+        user = self._receiver.find_user(name_query)
 
-        if user_q_res:
-            sentiment_text = user_q_res[0]['lastmessage']
+        if user:
+            sentiment_text = user['lastmessage']
 
         # Else just analyze the text as is
         else:
             sentiment_text = name_query
 
-        blob = TextBlob(sentiment_text)
-        pola = blob.sentiment.polarity
-        # subj = blob.sentiment.subjectivity
+        sentiment = self._receiver.sentiment_service.analyze(sentiment_text)
+        msg_natural = "The text: \"{0}\" is {1}.".format(
+            sentiment_text, self.polarity_str(sentiment.polarity))
+        msg_textblob = "textblob: {{pol={}, subj={}}}".format(
+            round(sentiment.polarity, 3),
+            round(sentiment.subjectivity, 3))
+        msg_vader = "vader: {}".format(sentiment.vader)
+
+        msg = msg_natural + " " + msg_textblob + " " + msg_vader
+
+        self._sender.send_privmsg(msg, self._receiver.channel,
+                                  self._receiver.max_message_length)
+        return True
+
+    def execute_batch(self, user: Dict, n: int) -> bool:
+        texts = user['messages'][-n:]
+        if not texts:
+            return False
+        sentiments = self._receiver.sentiment_service.analyze_batch(texts)
+        pola = sum(s.polarity for s in sentiments) / len(sentiments)
+        subj = sum(s.subjectivity for s in sentiments) / len(sentiments)
+        compound = sum(s.vader['compound'] for s in sentiments) / len(sentiments)
+
+        msg = ("The last {0} messages of {1} are {2} on average. "
+               "textblob: {{pol={3}, subj={4}}} vader: {{compound={5}}}"
+               ).format(len(texts), user['name'], self.polarity_str(pola),
+                        round(pola, 3), round(subj, 3), round(compound, 3))
+        self._sender.send_privmsg(msg, self._receiver.channel,
+                                  self._receiver.max_message_length)
+        return True
+
+    @staticmethod
+    def polarity_str(pola: float) -> str:
         pola_str = ""
         if pola == 0.0:
             pola_str = "neutral"
@@ -202,25 +250,11 @@ class SentimentCommand(Command):
             pola_str = "negative"
         elif -0.75 > pola >= -1.0:
             pola_str = "very negative"
-
-        msg_natural = "The text: \"{0}\" is {1}.".format(
-            sentiment_text, pola_str)
-        msg_textblob = "textblob: {{pol={}, subj={}}}".format(
-            round(blob.sentiment.polarity, 3),
-            round(blob.sentiment.subjectivity, 3))
-
-        analyzer = SentimentIntensityAnalyzer()
-        vs = analyzer.polarity_scores(sentiment_text)
-        msg_vader = "vader: {}".format(vs)
-
-        msg = msg_natural + " " + msg_textblob + " " + msg_vader
-
-        self._sender.send_privmsg(msg, self._receiver.channel,
-                                  self._receiver.max_message_length)
-        return True
+        return pola_str
 
 
 class FrequentWordsCommand(Command):
+    cost = 2.0
 
     @property
     def help_text(self) -> str:
@@ -233,38 +267,25 @@ class FrequentWordsCommand(Command):
         if not name_query:
             name_query = trigger_nick
 
-        user_q = Query()
-        user_q_res = self._receiver.user_db.search(
-            user_q.name.matches(name_query, flags=re.IGNORECASE))
+        # Only the name is needed, the word counts are kept up to date
+        name = self._receiver.user_index.find(name_query)
 
-        if not user_q_res:
+        if not name:
             self._sender.send_privmsg(
                 "I haven't encountered this user yet.",
                 self._receiver.channel, self._receiver.max_message_length)
             return True
 
-        msgs = list(user_q_res[0]['messages'])
-        msgs = [msg.lower() for msg in msgs]
+        # Bot commands and the nick itself are not words of the user
+        stopwords = Stopwords(self._receiver.command_stopwords,
+                              [name.lower()])
 
-        name = user_q_res[0]['name']
-
-        # Add bot commands to list of stop words
-        stopwords = STOPWORDS
-        stopwords.update(self._receiver.commands.keys())
-        stopwords.update([name.lower()])
-
-        # Build count vectorizer and count top words
+        # Count top words
         n = 10
-        cv = CountVectorizer(stop_words=stopwords)
-        bow = cv.fit_transform(msgs)
-        sums = bow.sum(axis=0)
-        counts = [(word, sums[0, index])
-                  for word, index in cv.vocabulary_.items()]
-        counts = sorted(counts, key=lambda x: x[1], reverse=True)
-        top_n = counts[:n]
+        top_n = self._receiver.word_index.top_words(name, n, stopwords)
 
         msg = "({}) Top words (of last {} messages) for {}: {}".format(
-            trigger_nick, self._receiver.user_db_message_log_size,
+            trigger_nick, self._receiver.user_db_history_size,
             name, self.format_count_list(top_n))
         self._sender.send_privmsg(msg, self._receiver.channel, self._receiver.max_message_length)
         return True
@@ -284,6 +305,7 @@ class FrequentWordsCommand(Command):
 
 
 class WordCloudCommand(Command):
+    cost = 10.0
 
     @property
     def help_text(self) -> str:
@@ -303,72 +325,125 @@ class WordCloudCommand(Command):
         except IndexError:
             pass
 
-        user_q = Query()
-        user_q_res = self._receiver.user_db.search(
-            user_q.name.matches(name_query, flags=re.IGNORECASE))
+        user = self._receiver.find_user(name_query)
 
-        if not user_q_res:
+        if not user:
             self._sender.send_privmsg(
                 "I haven't encountered this user yet.",
                 self._receiver.channel, self._receiver.max_message_length)
             return True
-        name = user_q_res[0]['name']
+        name = user['name']
+
+        # All kept user messages as a string, archived ones included
+        user_text = ' '.join(self._receiver.iter_user_messages(name))
+
+        # Bot commands and the nick itself are not words of the user
+        stopwords = Stopwords(self._receiver.command_stopwords,
+                              [name, name.lower()])
 
-        msg = "({}) Cloud generation for nick {} started...".format(
-            trigger_nick, name)
+        def on_done(link: Optional[str], error: Optional[BaseException]) -> None:
+            if error is not None:
+                logging.error(error)
+                msg = "Cloud generation for " + name + " failed."
+            else:
+                msg = "Cloud generated for " + name + ": " + str(link)
+            self._sender.send_privmsg(msg, self._receiver.channel,
+                                      self._receiver.max_message_length)
+
+        # Rendered and uploaded in the background, the link is posted
+        # once it is done
+        mask_path = find_mask(name, self._receiver.channel)
+        status = self._receiver.wordcloud_renderer.submit(
+            name, user_text, stopwords, use_title, mask_path, on_done,
+            self._receiver.channel)
+        if status == JOB_STARTED:
+            msg = "({}) Cloud generation for nick {} started...".format(
+                trigger_nick, name)
+        elif status == JOB_DUPLICATE:
+            msg = "({}) Cloud generation for nick {} is already running.".format(
+                trigger_nick, name)
+        elif status == JOB_CACHED:
+            # Already posted by on_done
+            return True
+        else:
+            msg = "({}) Too many clouds in the making, try again later.".format(
+                trigger_nick)
+        self._sender.send_privmsg(msg, self._receiver.channel,
+                                  self._receiver.max_message_length)
+        return status == JOB_STARTED
+
+
+class ChannelWordsCommand(Command):
+    cost = 3.0
+    max_hours = 24 * 7
+
+    @property
+    def help_text(self) -> str:
+        return "[hours] show the most used words in the channel"
+
+    def execute(self, args: List[str]) -> bool:
+        trigger_nick = args[0]
+        hours = Command.check_hours_arg(args[1], 1, self.max_hours)
+        if hours is None:
+            self._sender.send_privmsg(
+                "I need a number of hours up to {}.".format(self.max_hours),
+                self._receiver.channel, self._receiver.max_message_length)
+            return False
+
+        stopwords = self._receiver.command_stopwords
+        start = time.time() - hours * 3600
+        counts: 'collections.Counter[str]' = collections.Counter(
+            token for entry in self._receiver.channel_log.entries(start)
+            for token in tokenize(entry.message) if token not in stopwords)
+
+        msg = "({}) Top words (of last {} hours) in {}: {}".format(
+            trigger_nick, hours, self._receiver.channel,
+            FrequentWordsCommand.format_count_list(counts.most_common(10)))
         self._sender.send_privmsg(msg, self._receiver.channel,
                                   self._receiver.max_message_length)
+        return True
+
+
+class ActivityCommand(Command):
+    cost = 2.0
+    max_hours = 48
+    spark_chars = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+    @property
+    def help_text(self) -> str:
+        return "[hours] show messages per hour in the channel"
+
+    def execute(self, args: List[str]) -> bool:
+        trigger_nick = args[0]
+        hours = Command.check_hours_arg(args[1], 12, self.max_hours)
+        if hours is None:
+            self._sender.send_privmsg(
+                "I need a number of hours up to {}.".format(self.max_hours),
+                self._receiver.channel, self._receiver.max_message_length)
+            return False
 
-        # Get all user messages as a string
-        msgs = list(user_q_res[0]['messages'])
-        user_text = ' '.join(msgs)
-
-        # Add bot commands to list of stop words
-        stopwords = STOPWORDS
-        stopwords.update(self._receiver.commands.keys())
-        stopwords.update([name, name.lower()])
-
-        # Get tux outline image
-        module_path = Path(__file__).parent.absolute()
-        tux_path = module_path / "resources" / "tux.png"
-        mask = np.array(Image.open(str(tux_path)))
-
-        # Generate wordcloud
-        wc = WordCloud(stopwords=stopwords,
-                       background_color="white",
-                       mask=mask,
-                       # mode="RGBA",
-                       max_words=5000,
-                       # max_font_size=40
-                       )
-        wc.generate(user_text.lower())
-
-        # Create colormap from image
-        image_colors = ImageColorGenerator(mask)
-        plt.figure(figsize=[20, 20])
-        plt.imshow(wc.recolor(color_func=image_colors),
-                   interpolation="bilinear")
-        plt.axis("off")
-        if use_title:
-            title = "Wordcloud for " + name
-            plt.title(title, fontsize=36)
-
-        # Save on disk for later upload
-        Path('clouds').mkdir(exist_ok=True)
-        file_and_path = os.path.join('clouds', name + '.png')
-        plt.savefig(file_and_path, format="png")
-
-        # Upload wordcloud
-        res = upload(file_and_path)
-
-        os.remove(file_and_path)
-
-        msg = "Cloud generated for " + name + ": "
-        msg += res['link']
+        # One count per hour, the newest hour last
+        end = time.time()
+        start = end - hours * 3600
+        counts = [0] * hours
+        for entry in self._receiver.channel_log.entries(start, end):
+            counts[min(int((entry.timestamp - start) // 3600), hours - 1)] += 1
+
+        msg = "({}) Messages per hour (last {} hours): {} ({} total, " \
+              "at most {} an hour)".format(trigger_nick, hours,
+                                           self.sparkline(counts),
+                                           sum(counts), max(counts))
         self._sender.send_privmsg(msg, self._receiver.channel,
                                   self._receiver.max_message_length)
         return True
 
+    @staticmethod
+    def sparkline(counts: List[int]) -> str:
+        top = max(counts) or 1
+        steps = len(ActivityCommand.spark_chars) - 1
+        return ''.join(ActivityCommand.spark_chars[c * steps // top]
+                       for c in counts)
+
 
 class TimeCommand(Command):
 
@@ -452,6 +527,7 @@ class InterjectCommand(Command):
 
 
 class CopypastaCommand(Command):
+    cost = 3.0
 
     @property
     def help_text(self) -> str:
@@ -466,6 +542,8 @@ class CopypastaCommand(Command):
                                       self._receiver.max_message_length)
             return False
 
+        # Imported here, it pulls in praw
+        import copypasta_search as cps
         pasta_original, url_original = cps.get_copypasta(query)
         url = url_original if url_original else ''
 
@@ -504,3 +582,25 @@ class ShrugCommand(Command):
         self._sender.send_privmsg(msg, self._receiver.channel,
                                   self._receiver.max_message_length)
         return True
+
+
+# Loaded by the command registry, see COMMAND_MODULES
+COMMANDS: Dict[str, Type[Command]] = {
+    'about': AboutCommand,
+    'activity': ActivityCommand,
+    'chanwords': ChannelWordsCommand,
+    'cmds': CommandCommand,
+    'copypasta': CopypastaCommand,
+    'date': DateCommand,
+    'help': HelpCommand,
+    'interject': InterjectCommand,
+    'lastmessage': LmCommand,
+    'sentiment': SentimentCommand,
+    'shrug': ShrugCommand,
+    'time': TimeCommand,
+    'updog': UpdogCommand,
+    'uptime': UptimeCommand,
+    'weekday': WeekdayCommand,
+    'wordcloud': WordCloudCommand,
+    'words': FrequentWordsCommand,
+}
@@ -0,0 +1,211 @@
+import importlib
+import threading
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, \
+    Mapping, Optional, Type, TypeVar
+
+from src.command import Command
+
+# Entry point group of commands from other packages, name = module:Class
+ENTRY_POINT_GROUP = 'ircbot.commands'
+
+# Shorter prefixes are too easily typed by accident
+MIN_PREFIX_LENGTH = 3
+
+T = TypeVar('T')
+
+CommandLoader = Callable[[], Type[Command]]
+CommandFactory = Callable[[Type[Command]], Command]
+
+
+def get_entry_points(group: str) -> List[Any]:
+    # Imported here, scanning the installed packages is slow
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:  # Python 3.7
+        try:
+            from importlib_metadata import entry_points  # type: ignore
+        except ImportError:
+            return []
+    eps = entry_points()
+    # A dict of groups before Python 3.10
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    return list(eps.get(group, []))
+
+
+class _TrieNode(Generic[T]):
+    __slots__ = ('children', 'key', 'value', 'count')
+
+    def __init__(self) -> None:
+        self.children: Dict[str, '_TrieNode[T]'] = {}
+        self.key: Optional[str] = None
+        self.value: Optional[T] = None
+        # Keys ending at or below this node
+        self.count = 0
+
+
+class CommandTrie(Generic[T]):
+    """
+    Maps keys to values, and finds the only key starting with a prefix.
+    """
+
+    def __init__(self) -> None:
+        self._root: _TrieNode[T] = _TrieNode()
+
+    def _node(self, key: str) -> Optional[_TrieNode[T]]:
+        node = self._root
+        for char in key:
+            node = node.children.get(char)  # type: ignore
+            if node is None:
+                return None
+        return node
+
+    def get(self, key: str) -> Optional[T]:
+        node = self._node(key)
+        return node.value if node is not None and node.key is not None \
+            else None
+
+    def insert(self, key: str, value: T) -> None:
+        new = self.get(key) is None
+        node = self._root
+        if new:
+            node.count += 1
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if new:
+                node.count += 1
+        node.key = key
+        node.value = value
+
+    def remove(self, key: str) -> None:
+        if self.get(key) is None:
+            return
+        path = [self._root]
+        for char in key:
+            path.append(path[-1].children[char])
+        path[-1].key = None
+        path[-1].value = None
+        for depth, node in enumerate(path):
+            node.count -= 1
+            if not node.count and depth:
+                del path[depth - 1].children[key[depth - 1]]
+                break
+
+    def unique_prefix_match(self, prefix: str) -> Optional[T]:
+        node = self._node(prefix)
+        if node is None or node.count != 1:
+            return None
+        # Follow the single branch down to its key
+        while node.key is None:
+            node = next(iter(node.children.values()))
+        return node.value
+
+
+class CommandRegistry(Mapping[str, Command]):
+    """
+    The commands of the bot by name. Commands come from modules with a
+    COMMANDS dict of name to class, or from the ircbot.commands entry
+    points of installed packages. A command is only imported and created
+    when it is first looked up.
+
+    Names can have aliases, and a long enough prefix of a name or alias
+    resolves to it if it is the only match.
+
+    Without a factory the registry only holds registrations, bind gives
+    registries that create commands.
+    """
+
+    def __init__(self, factory: Optional[CommandFactory] = None) -> None:
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._loaders: Dict[str, CommandLoader] = {}
+        self._instances: Dict[str, Command] = {}
+        self._aliases: Dict[str, str] = {}
+        # Names and aliases to names
+        self._trie: CommandTrie[str] = CommandTrie()
+
+    def bind(self, factory: CommandFactory) -> 'CommandRegistry':
+        """
+        A registry of the same commands with its own instances, created by
+        factory. Registrations are shared, so make them before binding.
+        """
+        registry = CommandRegistry(factory)
+        registry._loaders = self._loaders
+        registry._aliases = self._aliases
+        registry._trie = self._trie
+        return registry
+
+    def register(self, name: str, loader: CommandLoader,
+                 aliases: Iterable[str] = ()) -> None:
+        with self._lock:
+            if name in self._aliases:
+                raise ValueError(f"{name} is already an alias")
+            self._loaders[name] = loader
+            self._instances.pop(name, None)
+            self._trie.insert(name, name)
+        for alias in aliases:
+            self.alias(alias, name)
+
+    def register_class(self, name: str, command_class: Type[Command],
+                       aliases: Iterable[str] = ()) -> None:
+        self.register(name, lambda: command_class, aliases)
+
+    def alias(self, alias: str, name: str) -> None:
+        with self._lock:
+            if name not in self._loaders:
+                raise KeyError(name)
+            if alias in self._loaders:
+                raise ValueError(f"{alias} is already a command")
+            self._aliases[alias] = name
+            self._trie.insert(alias, name)
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            if self._loaders.pop(name, None) is None:
+                return
+            self._instances.pop(name, None)
+            self._trie.remove(name)
+            for alias in [a for a, n in self._aliases.items() if n == name]:
+                del self._aliases[alias]
+                self._trie.remove(alias)
+
+    def load_module(self, module_name: str) -> None:
+        module = importlib.import_module(module_name)
+        for name, command_class in module.COMMANDS.items():  # type: ignore
+            self.register_class(name, command_class)
+
+    def load_entry_points(self, group: str = ENTRY_POINT_GROUP) -> None:
+        for ep in get_entry_points(group):
+            self.register(ep.name, ep.load)
+
+    def resolve(self, word: str) -> Optional[str]:
+        """
+        Name of the command meant by word: a name, an alias or the prefix
+        of only one of them.
+        """
+        name = self._trie.get(word)
+        if name is None and len(word) >= MIN_PREFIX_LENGTH:
+            name = self._trie.unique_prefix_match(word)
+        return name
+
+    def __getitem__(self, name: str) -> Command:
+        with self._lock:
+            command = self._instances.get(name)
+            if command is None:
+                # Raises KeyError for unknown names
+                loader = self._loaders[name]
+                if self._factory is None:
+                    raise TypeError("Unbound command registry")
+                command = self._factory(loader())
+                self._instances[name] = command
+            return command
+
+    def __contains__(self, name: object) -> bool:
+        # Without creating the command
+        return name in self._loaders
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._loaders))
+
+    def __len__(self) -> int:
+        return len(self._loaders)
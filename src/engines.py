@@ -0,0 +1,88 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import FrozenSet, Optional
+
+from src.commandregistry import CommandRegistry
+from src.sentiment import SentimentService
+from src.settings import CONFIG
+from src.util import get_stopwords, split_config
+from src.wordcloudrenderer import WordCloudRenderer
+
+
+def create_command_registry() -> CommandRegistry:
+    # Registrations only, each channel binds its own instances
+    registry = CommandRegistry()
+    for module_name in split_config(CONFIG['command_modules']):
+        registry.load_module(module_name)
+    registry.load_entry_points()
+    for name in split_config(CONFIG['disabled_commands']):
+        registry.unregister(name)
+    for alias_setting in split_config(CONFIG['command_aliases']):
+        alias, _, name = (s.strip() for s in alias_setting.partition('='))
+        try:
+            registry.alias(alias, name)
+        except (KeyError, ValueError) as e:
+            logging.warning("Skipping command alias %s: %s", alias, e)
+    return registry
+
+
+class Engines:
+    """
+    What the bots of all networks in a process share: the thread pools,
+    the command registrations and the engines and caches behind the
+    commands. Created once, so another network only adds its connection
+    and channels.
+    """
+
+    def __init__(self) -> None:
+        # Chat messages are handled in order on one thread, commands on a
+        # pool, so neither can stall the event loop answering PINGs
+        self.dispatch_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='dispatch')
+        self.command_executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix='command')
+
+        self.commands = create_command_registry()
+        self._command_stopwords: Optional[FrozenSet[str]] = None
+
+        self.sentiment_service = SentimentService()
+        self.wordcloud_renderer = WordCloudRenderer(
+            max_workers=int(CONFIG['wordcloud_workers']),
+            max_jobs=int(CONFIG['wordcloud_max_jobs']),
+            timeout=float(CONFIG['wordcloud_timeout']),
+            cache_size=int(CONFIG['wordcloud_cache_size']),
+            cache_ttl=float(CONFIG['wordcloud_cache_ttl']))
+
+    @property
+    def command_stopwords(self) -> FrozenSet[str]:
+        # Built on first use. Command names are not words of their users
+        if self._command_stopwords is None:
+            self._command_stopwords = get_stopwords() | frozenset(self.commands)
+        return self._command_stopwords
+
+    def warm_up(self) -> None:
+        """
+        Load the libraries and data that commands otherwise load on first
+        use, so no user has to wait for them.
+        """
+        start = time.perf_counter()
+        self.wordcloud_renderer.warm_up()
+        self.sentiment_service.warm_up()
+        _ = self.command_stopwords
+        import copypasta_search  # noqa: F401
+        logging.info("Warm-up done in %.2fs", time.perf_counter() - start)
+
+    def drain_dispatch(self) -> None:
+        # The dispatch thread runs in order, this waits for everything
+        # submitted before
+        try:
+            self.dispatch_executor.submit(lambda: None).result()
+        except RuntimeError:
+            # Already shut down, and so drained
+            pass
+
+    def shutdown(self) -> None:
+        self.command_executor.shutdown(wait=False)
+        self.dispatch_executor.shutdown(wait=True)
+        self.wordcloud_renderer.shutdown()
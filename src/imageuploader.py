@@ -1,14 +1,30 @@
-from typing import Dict
-
-from imgurpython import ImgurClient
+import base64
+import functools
+from typing import TYPE_CHECKING, Dict
 
 from src.settings import CONFIG
 
-CLIENT = ImgurClient(
-    CONFIG['imgur_client_id'],
-    CONFIG['imgur_client_secret']
-    )
+if TYPE_CHECKING:
+    from imgurpython import ImgurClient
+
+
+@functools.lru_cache(maxsize=None)
+def get_client() -> 'ImgurClient':
+    # Created on first upload, the client calls the API when created
+    from imgurpython import ImgurClient
+    return ImgurClient(
+        CONFIG['imgur_client_id'],
+        CONFIG['imgur_client_secret']
+        )
 
 
 def upload(path: str) -> Dict:
-    return CLIENT.upload_from_path(path, config=None, anon=True)
+    return get_client().upload_from_path(path, config=None, anon=True)
+
+
+def upload_bytes(data: bytes) -> Dict:
+    # Same request as upload_from_path, without the file
+    return get_client().make_request('POST', 'upload', {
+        'image': base64.b64encode(data),
+        'type': 'base64',
+    }, True)
@@ -2,78 +2,134 @@ __author__ = "Lorenz Leitner"
 __version__ = "1.3.3"
 __license__ = "MIT"
 
-import collections
+import asyncio
 import json
 import logging
 import os
 import random
-import socket
+import signal
 import string
 import threading
 import time
-from typing import Tuple, List, Dict, Union
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, FrozenSet, Tuple, List, Dict, Optional, Set
 from pathlib import Path
-
-from tinydb import TinyDB, Query
-
-from src.command import HelpCommand, CommandCommand, AboutCommand, \
-    LmCommand, SentimentCommand, TimeCommand, DateCommand, \
-    UptimeCommand, UpdogCommand, FrequentWordsCommand, \
-    WordCloudCommand, WeekdayCommand, InterjectCommand, \
-    CopypastaCommand, ShrugCommand, Command
+from urllib.parse import quote
+
+from src.channel import Channel, move_legacy_storage
+from src.channellog import ChannelLog
+from src.command import Command
+from src.commandregistry import CommandRegistry
+from src.engines import Engines
+from src.ratelimit import CommandLimiter
 from src.receiver.receiver import Receiver
-from src.sender.sender import Sender
+from src.sender.sender import Sender, PRIORITY_LOW
+from src.sender.splitter import byte_length
 from src.settings import CONFIG
-from src.ircmsg import IrcMsg
+from src.resourcewatcher import ResourceSnapshot, ResourceWatcher
+from src.sentiment import SentimentService
+from src.triggermatcher import TriggerMatcher
+from src.util import split_config
+from src.wordcloudrenderer import WordCloudRenderer
+from src.wordindex import WordFrequencyIndex
+from src.ircmsg import IrcMsg, Message, parse_line
+from src.userstore.messagearchive import MessageArchive
+from src.userstore.migration import migrate_tinydb_users
+from src.userstore.residentuserstore import ResidentUserStore
+from src.userstore.sqliteuserstore import SqliteUserStore
+from src.userstore.tinydbuserstore import TinyDBUserStore
+from src.userstore.userstore import UserStore
+from src.userstore.writebehinduserstore import WriteBehindUserStore
 
 # Misc settings
 logging.basicConfig(format='%(asctime)s %(levelname)s:%(message)s',
                     level=logging.DEBUG)
 BOT_PATH = os.path.dirname(os.path.abspath(__file__))
+RESOURCE_FILES = ['responses.txt', 'bots.txt', 'triggers.json']
 
 
 class IRCBot:
-    def __init__(self) -> None:
-        # Socket
-        self._irc_sock: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    """
+    The bot on one network. Bots of several networks can run on one event
+    loop and share engines, each with its own connection, config (see
+    get_network_config) and storage_dir.
+    """
+
+    def __init__(self, config: Optional[Dict[str, str]] = None,
+                 engines: Optional[Engines] = None,
+                 storage_dir: Optional[str] = None) -> None:
+        config = CONFIG if config is None else config
+        self._storage_dir = IRCBot.get_storage_dir_file('') \
+            if storage_dir is None else storage_dir
+
+        # Connection
+        self._port = int(config['port'])
         self._socket_timeout = 60 * 3  # 2 min pings on snoonet
+        self._quit_timeout = 5.0
+        self._running = False
+        self._main_task: Optional[asyncio.Task] = None
+        # Networks may confirm the login twice, by NOTICE and by 900
+        self._joined = False
 
         # User defined options
-        self._server: str = CONFIG['server']
-        self._channel: str = CONFIG['channel']
-        self._nick: str = CONFIG['bot_nick']
-        self._password: str = CONFIG['password']
-        self._admin_name: str = CONFIG['admin_name']
-        self._exitcode: str = CONFIG['exit_code']
-        self._command_prefix: str = CONFIG['command_prefix']
+        self._server: str = config['server']
+        self._nick: str = config['bot_nick']
+        self._password: str = config['password']
+        self._admin_name: str = config['admin_name']
+        self._exitcode: str = config['exit_code']
+        self._command_prefix: str = config['command_prefix']
         self._user_db_message_log_size: int = int(CONFIG['user_db_message_log_size'])
-        self._user_db: TinyDB = TinyDB(IRCBot.get_storage_dir_file('users.json'))
 
         # Default memvars
         self._max_user_name_length = 17  # Freenode, need to check snoonet
-        self._max_message_length = 0  # Set later
-        self._responses: List[str] = []
-        self._bot_bros: List[str] = []
-        self._triggers: Dict[str, List] = {}
-        self._min_msg_interval = 1.01
-        self._last_command_time = 0.0
+        # Derived from the resource files, swapped as a whole on change
+        self._resources = ResourceSnapshot((), frozenset(), TriggerMatcher({}))
         self._last_ping_time: float = time.time()
-        self._re_files_txt_interval = 60.0 * 15
-        self._repeated_message_sleep_time = 1.25
+        self._resource_poll_interval = 5.0
+        self._repeated_message_sleep_time = float(config['send_interval'])
+        self._send_burst = int(config['send_burst'])
         self._user_meta = ""  # Set later
         self._replace_strings = ['ADMIN', 'USER', 'BOTNAME', 'COMMANDPREFIX']
         self._version: str = __version__
-        self._join_time = 0.0
         self._join_delay = 10.0
-        self._ignoring_messages = True
+
+        # Thread pools and the engines behind the commands, maybe shared
+        # with the bots of other networks
+        self._owns_engines = engines is None
+        self._engines = Engines() if engines is None else engines
 
         # IRC message sender (and receiver) (TODO: Inject dependencies)
-        self._sender = Sender(self._irc_sock, self.repeated_message_sleep_time)
-        self._receiver = Receiver(self._irc_sock, self._socket_timeout)
+        # Connected to the stream writer/reader once the loop runs
+        self._sender = Sender(None, self.repeated_message_sleep_time,
+                              self._send_burst)
+        self._receiver = Receiver(None, self._socket_timeout)
+
+        # IRC command -> handler, called on the event loop
+        self._handlers: Dict[str, Callable[[Message], None]] = {
+            'PRIVMSG': self.on_privmsg,
+            'ERROR': self.on_error,
+            'JOIN': self.on_join,
+            'PING': self.on_ping,
+            'NOTICE': self.on_login_notice,
+            '900': self.on_login_notice,  # RPL_LOGGEDIN
+        }
 
-        # Commands (must be after sender, because commands need the sender)
-        self._commands: Dict[str, Command] = self.create_commands(self._sender)
-        self._max_command_length = self.get_max_command_length()
+        # Channels by lower case name, the first one keeps the storage of
+        # the single channel bot
+        self._channels: Dict[str, Channel] = {}
+        for i, channel_name in enumerate(split_config(config['channel'])):
+            if i == 0:
+                move_legacy_storage(
+                    self._storage_dir,
+                    self.get_channel_storage_dir(channel_name))
+            self.add_channel(channel_name)
+
+        # Channels can have their own triggers.<channel>.json
+        self._resource_watcher = ResourceWatcher(
+            [IRCBot.get_resources_dir_file(f) for f in RESOURCE_FILES] +
+            [IRCBot.get_resources_dir_file(IRCBot.get_triggers_filename(c))
+             for c in self._channels.values()],
+            self.reload_resources, self._resource_poll_interval)
 
         self._creation_time: float = time.time()
 
@@ -86,8 +142,16 @@ class IRCBot:
         return self._command_prefix
 
     @property
-    def commands(self) -> Dict[str, Command]:
-        return self._commands
+    def commands(self) -> CommandRegistry:
+        return self._engines.commands
+
+    @property
+    def command_stopwords(self) -> FrozenSet[str]:
+        return self._engines.command_stopwords
+
+    @property
+    def engines(self) -> Engines:
+        return self._engines
 
     @property
     def repeated_message_sleep_time(self) -> float:
@@ -102,12 +166,8 @@ class IRCBot:
         return self._version
 
     @property
-    def channel(self) -> str:
-        return self._channel
-
-    @property
-    def user_db(self) -> TinyDB:
-        return self._user_db
+    def channels(self) -> Dict[str, Channel]:
+        return self._channels
 
     @property
     def user_db_message_log_size(self) -> int:
@@ -118,54 +178,121 @@ class IRCBot:
         return self._creation_time
 
     @property
-    def triggers(self) -> Dict[str, List]:
-        return self._triggers
+    def resources(self) -> ResourceSnapshot:
+        return self._resources
 
     @property
-    def max_message_length(self) -> int:
-        return self._max_message_length
-
-    def create_commands(self, sender: Sender) -> Dict[str, Command]:
-        return {
-            'about': AboutCommand(self, sender),
-            'cmds': CommandCommand(self, sender),
-            'copypasta': CopypastaCommand(self, sender),
-            'date': DateCommand(self, sender),
-            'help': HelpCommand(self, sender),
-            'interject': InterjectCommand(self, sender),
-            'lastmessage': LmCommand(self, sender),
-            'sentiment': SentimentCommand(self, sender),
-            'shrug': ShrugCommand(self, sender),
-            'time': TimeCommand(self, sender),
-            'updog': UpdogCommand(self, sender),
-            'uptime': UptimeCommand(self, sender),
-            'weekday': WeekdayCommand(self, sender),
-            'wordcloud': WordCloudCommand(self, sender),
-            'words': FrequentWordsCommand(self, sender),
-        }
+    def sentiment_service(self) -> SentimentService:
+        return self._engines.sentiment_service
+
+    @property
+    def wordcloud_renderer(self) -> WordCloudRenderer:
+        return self._engines.wordcloud_renderer
+
+    def add_channel(self, name: str) -> Channel:
+        """
+        Create the state of a channel, to be joined after login.
+        """
+        directory = self.get_channel_storage_dir(name)
+        os.makedirs(directory, exist_ok=True)
+        archive = None
+        archive_size = int(CONFIG['user_db_archive_size'])
+        if archive_size > 0:
+            # The word counts cover the archive, expired messages need a
+            # recount
+            archive = MessageArchive(
+                os.path.join(directory, 'archive'),
+                segment_size=int(CONFIG['user_db_archive_segment_size']),
+                max_messages=archive_size,
+                on_expire=lambda user: channel.word_index.invalidate(user))
+        user_db = ResidentUserStore(
+            WriteBehindUserStore(
+                self.create_user_store(directory, CONFIG['user_db_backend'],
+                                       self._user_db_message_log_size,
+                                       archive),
+                flush_interval=float(CONFIG['user_db_flush_interval']),
+                flush_size=int(CONFIG['user_db_flush_size'])),
+            max_users=int(CONFIG['user_db_resident_users']))
+        channel = Channel(
+            self, name, user_db,
+            # Only a store that keeps an archive has history beyond the
+            # log, the tinydb one drops it
+            word_index=WordFrequencyIndex(
+                self._user_db_message_log_size, user_db.iter_messages,
+                archived=user_db.history_size >
+                self._user_db_message_log_size),
+            channel_log=ChannelLog(
+                os.path.join(directory, 'log'),
+                segment_seconds=int(CONFIG['channel_log_segment_seconds']),
+                max_segments=int(CONFIG['channel_log_max_segments'])),
+            command_limiter=CommandLimiter(
+                user_rate=float(CONFIG['command_user_rate']),
+                user_burst=float(CONFIG['command_user_burst']),
+                command_rate=float(CONFIG['command_rate']),
+                command_burst=float(CONFIG['command_burst']),
+                max_delay=float(CONFIG['command_max_delay'])),
+            # Each channel has its own command instances
+            commands=self.commands.bind(
+                lambda cls: cls(channel, self._sender)))
+        channel.trigger_matcher = self._resources.trigger_matcher
+        self._channels[name.lower()] = channel
+        return channel
+
+    def get_channel(self, name: str) -> Optional[Channel]:
+        return self._channels.get(name.lower())
+
+    @staticmethod
+    def create_user_store(directory: str, backend: str,
+                          message_log_size: int,
+                          archive: Optional[MessageArchive] = None
+                          ) -> UserStore:
+        legacy_path = os.path.join(directory, 'users.json')
+        if backend == 'tinydb':
+            if archive is not None:
+                logging.warning("The tinydb user db has no archive")
+            return TinyDBUserStore(legacy_path, message_log_size)
+        if backend == 'sqlite':
+            store = SqliteUserStore(
+                os.path.join(directory, 'users.sqlite3'), message_log_size,
+                archive)
+            if store.is_empty():
+                migrate_tinydb_users(legacy_path, store)
+            return store
+        raise ValueError(f"Unknown user db backend: {backend}")
 
     @staticmethod
     def get_storage_dir_file(filename: str) -> str:
         return str(Path(BOT_PATH).parent / 'storage' / filename)
 
+    def get_channel_storage_dir(self, channel: str) -> str:
+        # Channel names may contain slashes
+        return os.path.join(self._storage_dir, 'channels',
+                            quote(channel.lower(), safe='#'))
+
+    @staticmethod
+    def get_triggers_filename(channel: Channel) -> str:
+        return f'triggers.{quote(channel.name.lower(), safe="#")}.json'
+
     @staticmethod
     def get_resources_dir_file(filename: str) -> str:
         return str(Path(BOT_PATH) / 'resources' / filename)
 
-    def _reset_socket(self) -> None:
-        self._irc_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._sender.irc_socket = self._irc_sock
-        self._receiver.irc_socket = self._irc_sock
+    def _close_connection(self) -> None:
+        self._sender.close()
 
-    def connect(self, reconnect: bool = False) -> bool:
+    async def connect(self, reconnect: bool = False) -> bool:
         if reconnect:
-            self._reset_socket()
+            self._close_connection()
         try:
-            self._irc_sock.connect((self._server, 6667))
-        except socket.gaierror as e:
+            reader, writer = await asyncio.open_connection(self._server,
+                                                           self._port)
+        except OSError as e:
             logging.error(e)
             return False
 
+        self._receiver.reader = reader
+        self._sender.writer = writer
+        self._joined = False
         logging.info("socket connection established")
         self._sender.send_auth(self._nick, self._password)
         logging.info("initial IRC connection successful")
@@ -173,12 +300,9 @@ class IRCBot:
 
     def join(self, chan: str) -> None:
         self._sender.send_join(chan)
-        self._join_time = time.time()
-
-    def ping(self, msg: str) -> None:
-        # PING code can be in a multiline message
-        ping_code = msg[msg.rindex('PING') + len('PING :'):]
-        self._sender.send_pong(ping_code)
+        channel = self.get_channel(chan)
+        if channel is not None:
+            channel.join_time = time.time()
 
     def startbatch(self, channel: str) -> str:
         batch_id = ''.join(random.choices(
@@ -192,22 +316,16 @@ class IRCBot:
     def endbatch(self, batch_id: str) -> None:
         self._sender.send_end_batch(batch_id)
 
-    def receive_msg(self) -> Union[str, List[str]]:
-        return self._receiver.receive_msg()
+    async def receive_msg(self) -> List[str]:
+        return await self._receiver.receive_msg()
 
-    def get_max_command_length(self) -> int:
-        max_length = 0
-        for command_name in self.commands:
-            if len(command_name) > max_length:
-                max_length = len(command_name)
-        return max_length
-
-    def get_max_message_length(self) -> int:
+    def get_max_message_length(self, channel: str) -> int:
+        # In bytes, as is the IRC line limit
         irc_max_msg_len = 510
         return irc_max_msg_len - (
-                len(self._user_meta) +
+                byte_length(self._user_meta) +
                 len("PRIVMSG ") +
-                len(self.channel) +
+                byte_length(channel) +
                 len(" :") +
                 len("\n"))
 
@@ -226,8 +344,8 @@ class IRCBot:
         bots = [b.strip() for b in bots]
         return bots
 
-    def get_triggers(self) -> Dict[str, List]:
-        with open(os.path.join(IRCBot.get_resources_dir_file('triggers.json'))) as f:
+    def get_triggers(self, filename: str = 'triggers.json') -> Dict[str, List]:
+        with open(os.path.join(IRCBot.get_resources_dir_file(filename))) as f:
             triggers = json.load(f)
 
         # Replace placeholders in file with variables
@@ -244,188 +362,302 @@ class IRCBot:
         return self.get_responses(), self.get_bot_bros(), self.get_triggers()
 
     def run(self) -> None:
-        self.connect()
-
-        # Thread to re-read the database files
-        t_read_database = threading.Thread(
-            target=self.re_read_txt_database_loop)
-        t_read_database.start()
-
-        # Thread to continuously receive and parse messages
-        t_recv_parse_msg = threading.Thread(
-            target=self.receive_and_parse_msg_loop)
-        t_recv_parse_msg.start()
-
-    def re_read_txt_database_loop(self) -> None:
-        while True:
-            read_ins = self.read_db_txt_files()
-            self._responses = read_ins[0]
-            self._bot_bros = read_ins[1]
-            self._triggers = read_ins[2]
-            time.sleep(self._re_files_txt_interval)
-
-    def receive_and_parse_msg_loop(self) -> None:
-        t = threading.currentThread()
-        while getattr(t, "do_run", True):
-            self.receive_and_parse_msg()
-
-    def receive_and_parse_msg(self) -> None:
-        ircmsgs = self.receive_msg()
+        asyncio.run(self.run_async())
+
+    async def run_async(self, handle_signals: bool = True) -> None:
+        self.reload_resources()
+        self._main_task = asyncio.current_task()
+        # Else whoever runs several bots handles them
+        if handle_signals:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, self.handle_sigterm)
+        self._running = True
+        await self.connect()
+
+        # Watch the resource files for changes
+        self._resource_watcher.start()
+
+        if CONFIG['warm_up'] == "1" and self._owns_engines:
+            self.submit(self._engines.command_executor,
+                        self._engines.warm_up)
+
+        # Continuously receive and parse messages
+        try:
+            await self.receive_and_parse_msg_loop()
+        except asyncio.CancelledError:
+            logging.info("Receive loop cancelled")
+        finally:
+            self._resource_watcher.stop()
+            await self.shutdown()
+
+    async def shutdown(self) -> None:
+        self._running = False
+        # Waiting for commands and flushing the user dbs blocks, keep the
+        # loop (and other networks on it) going meanwhile
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._close_channels)
+        await self._send_quit()
+        self._close_connection()
+
+    def _close_channels(self) -> None:
+        if self._owns_engines:
+            self._engines.shutdown()
+        else:
+            # Shared, only wait for the messages of this bot to be handled
+            self._engines.drain_dispatch()
+        logging.info("Flushing user db")
+        for channel in self._channels.values():
+            channel.close()
+
+    async def _send_quit(self) -> None:
+        # After the replies already queued, as far as the flood limit
+        # allows within the timeout
+        try:
+            future = self._sender.enqueue("QUIT \n", PRIORITY_LOW,
+                                          with_future=True)
+            await asyncio.wait_for(asyncio.wrap_future(future),
+                                   self._quit_timeout)
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            logging.warning("QUIT not sent: %r", e)
+
+    def handle_sigterm(self) -> None:
+        logging.info("SIGTERM received, shutting down")
+        # Once shutting down, don't interrupt the flush
+        if self._running and self._main_task is not None:
+            self._main_task.cancel()
+
+    def reload_resources(self, changed: Optional[Set[str]] = None) -> None:
+        # Rebuild what changed (everything if changed is None), reuse the
+        # rest and publish it all at once
+        def is_changed(filename: str) -> bool:
+            return (changed is None or
+                    IRCBot.get_resources_dir_file(filename) in changed)
+
+        old = self._resources
+        responses = old.responses
+        bot_bros = old.bot_bros
+        trigger_matcher = old.trigger_matcher
+        if is_changed('responses.txt'):
+            responses = tuple(self.get_responses())
+        if is_changed('bots.txt'):
+            bot_bros = frozenset(self.get_bot_bros())
+        if is_changed('triggers.json'):
+            triggers = self.get_triggers()
+            # Only recompile the matcher if the trigger table changed
+            if triggers != trigger_matcher.triggers:
+                trigger_matcher = TriggerMatcher(triggers)
+        self._resources = ResourceSnapshot(responses, bot_bros,
+                                           trigger_matcher)
+
+        # A channel's own triggers replace the shared ones
+        for channel in self._channels.values():
+            filename = IRCBot.get_triggers_filename(channel)
+            if not os.path.isfile(IRCBot.get_resources_dir_file(filename)):
+                channel.trigger_matcher = trigger_matcher
+            elif (is_changed(filename) or
+                  channel.trigger_matcher is old.trigger_matcher):
+                channel.trigger_matcher = TriggerMatcher(
+                    self.get_triggers(filename))
+
+    async def receive_and_parse_msg_loop(self) -> None:
+        while self._running:
+            await self.receive_and_parse_msg()
+
+    async def receive_and_parse_msg(self) -> None:
+        ircmsgs = await self.receive_msg()
         for ircmsg in ircmsgs:
-            self.receive_and_parse_irc_msg(ircmsg)
+            await self.receive_and_parse_irc_msg(ircmsg)
 
-    def check_if_ignore_messages(self) -> bool:
+    def check_if_ignore_messages(self, channel: Channel) -> bool:
         # Ignore messages the first n seconds after joining
         # Prevents duplicate parsing of backfeed messages
-        if (time.time() - self._join_time) < self._join_delay:
-            logging.info("Still ignoring messages")
+        if (time.time() - channel.join_time) < self._join_delay:
+            logging.info("Still ignoring messages in %s", channel.name)
             return True
         else:
-            if self._ignoring_messages:
+            if channel.ignoring_messages:
                 logging.info(
-                    f"Stopped ignoring messages after "
+                    f"Stopped ignoring messages in {channel.name} after "
                     f"{self._join_delay} seconds")
-            self._ignoring_messages = False
+            channel.ignoring_messages = False
             return False
 
-    def receive_and_parse_irc_msg(self, raw_ircmsg: str) -> None:
+    async def receive_and_parse_irc_msg(self, raw_ircmsg: str) -> None:
         if not raw_ircmsg:
             logging.info("empty raw_ircmsg possibly due to timeout/no connection")
-            self.connect(reconnect=True)
-            time.sleep(self._socket_timeout / 10)
+            await self.connect(reconnect=True)
+            await asyncio.sleep(self._socket_timeout / 10)
             return
 
-        if raw_ircmsg.find("PRIVMSG") != -1:
-            if self.check_if_ignore_messages():
-                return
+        message = parse_line(raw_ircmsg)
+        if message is None:
+            logging.warning("Unparsable IRC line: %s", raw_ircmsg)
+            return
+        handler = self._handlers.get(message.command)
+        if handler is not None:
+            handler(message)
 
-            ircmsg = IrcMsg.from_raw(raw_ircmsg)
-            logging.debug("Parsed IRC message:")
-            logging.debug(ircmsg)
+    def on_privmsg(self, message: Message) -> None:
+        self.submit(self._engines.dispatch_executor, self.handle_privmsg,
+                    message)
 
-            if ircmsg is None:
-                logging.warning("IRC message parsing failed, see previous log")
-                return
+    def on_error(self, message: Message) -> None:
+        logging.error(message.trailing)
 
-            # Ignore PMs
-            if ircmsg.channel == self.nick:
-                logging.warning("Ignoring PM from: " + ircmsg.name)
-                return
+    def on_join(self, message: Message) -> None:
+        if message.nick.lower() != self._nick.lower():
+            return
+        # Grab user meta info similar to USERHOST
+        self._user_meta = ':' + message.prefix
+
+        # Calculate max message length once that info is known
+        channel = self.get_channel(message.params[0]) if message.params \
+            else None
+        if channel is not None:
+            channel.max_message_length = \
+                self.get_max_message_length(channel.name)
+
+    def on_ping(self, message: Message) -> None:
+        self._sender.send_pong(message.trailing)
+        self._last_ping_time = time.time()
+
+    def on_login_notice(self, message: Message) -> None:
+        if self._joined:
+            return
+        if message.trailing.find("You are now logged in as " + self._nick) != -1:
+            self._joined = True
+            for channel in self._channels.values():
+                self.join(channel.name)
+
+    @staticmethod
+    def submit(executor: Executor, fn: Callable, *args: Any) -> Future:
+        future = executor.submit(fn, *args)
+        future.add_done_callback(IRCBot._log_future_exception)
+        return future
+
+    @staticmethod
+    def _log_future_exception(future: Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(future.exception())
+
+    def handle_privmsg(self, message: Message) -> None:
+        ircmsg = IrcMsg.from_message(message)
+        logging.debug("Parsed IRC message:")
+        logging.debug(ircmsg)
+
+        if ircmsg is None:
+            logging.warning("IRC message parsing failed, see previous log")
+            return
+
+        # Ignore PMs and channels that are not ours
+        channel = self.get_channel(ircmsg.channel)
+        if channel is None:
+            logging.warning("Ignoring message to %s from: %s",
+                            ircmsg.channel, ircmsg.name)
+            return
+
+        if self.check_if_ignore_messages(channel):
+            return
+
+        # Put user in data base or update existing user
+        channel.add_message(ircmsg.name, ircmsg.msg)
+
+        if (ircmsg.name.lower() == self.admin_name.lower() and
+                ircmsg.msg.rstrip() == self._exitcode):
+            self._sender.send_privmsg("cya", channel.name,
+                                      channel.max_message_length)
+            self._sender.send_quit(priority=PRIORITY_LOW)
+            for c in self._channels.values():
+                c.user_db.flush()
+            return
 
-            # Put user in data base or update existing user
-            self.handle_user_on_message(ircmsg.name, ircmsg.msg)
+        # Normal user messages/commands
+        if len(ircmsg.name) < self._max_user_name_length:
+            resources = self.resources
+            if ircmsg.name in resources.bot_bros:
+                if random.random() < 0.01:
+                    self._sender.send_privmsg(
+                        "{} is my bot-bro.".format(ircmsg.name),
+                        channel.name, channel.max_message_length)
+                    return
 
-            if (ircmsg.name.lower() == self.admin_name.lower() and
-                    ircmsg.msg.rstrip() == self._exitcode):
-                self._sender.send_privmsg("cya", self.channel,
-                                          self.max_message_length)
-                self._sender.send_quit()
+            if self.respond_to_trigger(channel, ircmsg.name, ircmsg.msg):
                 return
 
-            # Normal user messages/commands
-            if len(ircmsg.name) < self._max_user_name_length:
-                if ircmsg.name in self._bot_bros:
-                    if random.random() < 0.01:
-                        self._sender.send_privmsg(
-                            "{} is my bot-bro.".format(ircmsg.name),
-                            self.channel, self.max_message_length)
-                        return
+            if ircmsg.msg.lower().find(self._nick) != -1:
+                if random.random() < 0.25:
+                    choice = random.choice(resources.responses)
+                    choice = choice.replace("USER", ircmsg.name, 1)
+                    self._sender.send_privmsg(choice, channel.name,
+                                              channel.max_message_length)
 
-                if self.respond_to_trigger(ircmsg.name, ircmsg.msg):
+            elif ircmsg.msg[:1] == self.command_prefix:
+                # No command after command prefix
+                if len(ircmsg.msg.strip()) == 1:
                     return
 
-                if ircmsg.msg.lower().find(self._nick) != -1:
-                    if random.random() < 0.25:
-                        choice = random.choice(self._responses)
-                        choice = choice.replace("USER", ircmsg.name, 1)
-                        self._sender.send_privmsg(choice, self.channel,
-                                                  self.max_message_length)
-
-                elif ircmsg.msg[:1] == self.command_prefix:
-                    # No command after command prefix
-                    if len(ircmsg.msg.strip()) == 1:
-                        return
-
-                    time_now = time.time()
-                    if ((time_now - self._last_command_time) <
-                            self._min_msg_interval):
-                        logging.info(
-                            "Too many commands, trigger_user: %s", ircmsg.name)
-                        return
-
-                    # Execute command
-                    self.execute_command(ircmsg.name, ircmsg.msg)
-                    self._last_command_time = time.time()
-
-        elif raw_ircmsg.find("ERROR") != -1:
-            logging.error(raw_ircmsg)
-
-        elif raw_ircmsg.find("JOIN") != -1:
-            # Grab user meta info similar to USERHOST
-            self._user_meta = raw_ircmsg.split(maxsplit=1)[0]
-
-            # Calculate max message length once that info is known
-            self._max_message_length = self.get_max_message_length()
-
-        elif raw_ircmsg.find("PING :") != -1:
-            self.ping(raw_ircmsg)
-            self._last_ping_time = time.time()
-
-        # PRIVMSG and NOTICE with this are sometimes together
-        if raw_ircmsg.find(":You are now logged in as " + self._nick) != -1:
-            self.join(self.channel)
-
-    def respond_to_trigger(self, name: str, message: str) -> bool:
-        trigger_keys = list(self.triggers.keys())
-        for trigger_key in trigger_keys:
-
-            # Check if message contains trigger key
-            if message.lower().find(trigger_key) != -1:
-
-                # Check if trigger key is command
-                if '.' in trigger_key:
-                    # Then it must be at the beginning
-                    if not message.lower().startswith(trigger_key):
-                        return False
-
-                chance = self.triggers[trigger_key][0]
-                if random.random() < chance:
-                    response = random.choice(self.triggers[trigger_key][1:])
-                    response = response.replace('BOTNAME', self._nick)
-                    response = response.replace('ADMIN', self.admin_name)
-                    response = response.replace('USER', name)
-                    self._sender.send_privmsg(response, self.channel,
-                                              self.max_message_length)
-                    return True
+                # Execute command
+                self.execute_command(channel, ircmsg.name, ircmsg.msg)
+
+    def respond_to_trigger(self, channel: Channel, name: str,
+                           message: str) -> bool:
+        # One matcher for both lookups, even if it is swapped meanwhile
+        matcher = channel.trigger_matcher
+        message_lower = message.lower()
+
+        # Trigger keys contained in the message, in table order
+        for trigger_key in matcher.find_all(message_lower):
+
+            # Check if trigger key is command
+            if '.' in trigger_key:
+                # Then it must be at the beginning
+                if not message_lower.startswith(trigger_key):
+                    return False
+
+            chance = matcher.triggers[trigger_key][0]
+            if random.random() < chance:
+                response = random.choice(matcher.triggers[trigger_key][1:])
+                response = response.replace('BOTNAME', self._nick)
+                response = response.replace('ADMIN', self.admin_name)
+                response = response.replace('USER', name)
+                self._sender.send_privmsg(response, channel.name,
+                                          channel.max_message_length)
+                return True
         return False
 
-    def handle_user_on_message(self, name: str, message: str) -> None:
-        user_q = Query()
-        user_q_res = self.user_db.get(user_q.name == name)
-        if not user_q_res:
-            msgs: collections.deque = collections.deque(maxlen=self.user_db_message_log_size)
-            msgs.append(message)
-            self.user_db.insert({'name': name,
-                                 'lastseen': time.time(),
-                                 'lastmessage': message,
-                                 'messages': list(msgs)})
-        else:
-            msgs = collections.deque(user_q_res['messages'],
-                                     maxlen=self.user_db_message_log_size)
-            msgs.append(message)
-            self.user_db.update({'lastseen': time.time(),
-                                 'lastmessage': message,
-                                 'messages': list(msgs)
-                                 }, user_q.name == name)
-
-    def execute_command(self, name: str, message: str) -> None:
-        command_name = message[1:self._max_command_length + 1]
-        if not ''.join(command_name.split()):
+    def execute_command(self, channel: Channel, name: str,
+                        message: str) -> None:
+        words = message[1:].split(None, 1)
+        if not words:
+            return
+        command_name = channel.commands.resolve(words[0])
+
+        if command_name is None:
             return
-        command_name = command_name.split()[0]
+        command = channel.commands[command_name]
+
+        delay = channel.command_limiter.acquire(name, command_name,
+                                                command.cost)
+        if delay is None:
+            logging.info("Too many commands, trigger_user: %s", name)
+        elif delay:
+            logging.info("Deferring %s of %s by %.1fs", command_name, name,
+                         delay)
+            timer = threading.Timer(delay, self.run_deferred_command,
+                                    (channel, name, command, message))
+            timer.daemon = True
+            timer.start()
+        else:
+            # Run on the command pool, errors are logged by the done callback
+            self.submit(self._engines.command_executor, command.execute,
+                        [name, message])
 
+    def run_deferred_command(self, channel: Channel, name: str,
+                             command: Command, message: str) -> None:
+        channel.command_limiter.release_deferred(name)
         try:
-            if command_name in self.commands:
-                self.commands[command_name].execute([name, message])
-        except Exception as e:
-            logging.error(e)
+            self.submit(self._engines.command_executor, command.execute,
+                        [name, message])
+        except RuntimeError:
+            # The executor was shut down meanwhile
+            logging.info("Dropping deferred command of %s", name)
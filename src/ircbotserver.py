@@ -1,10 +1,47 @@
+import asyncio
+import os
 import platform
+import signal
+from typing import List
 
+from src.engines import Engines
 from src.ircbot import IRCBot
+from src.settings import CONFIG, get_network_config
+from src.util import split_config
 
 
 def main() -> None:
     # Define server, channel, nick, etc. in config.yaml
     print(f"Python version: {platform.python_version()}")
-    irc_bot = IRCBot()
-    irc_bot.run()
+    networks = split_config(CONFIG['networks'])
+    if not networks:
+        irc_bot = IRCBot()
+        irc_bot.run()
+        return
+    asyncio.run(run_networks(networks))
+
+
+async def run_networks(networks: List[str]) -> None:
+    """
+    Run a bot per network on this event loop. They share the engines, the
+    first network keeps the storage of a single network bot.
+    """
+    engines = Engines()
+    bots = [IRCBot(get_network_config(network), engines,
+                   None if i == 0 else IRCBot.get_storage_dir_file(
+                       os.path.join('networks', network.lower())))
+            for i, network in enumerate(networks)]
+
+    def handle_sigterm() -> None:
+        for bot in bots:
+            bot.handle_sigterm()
+
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, handle_sigterm)
+    if CONFIG['warm_up'] == "1":
+        engines.command_executor.submit(engines.warm_up)
+    try:
+        await asyncio.gather(
+            *(bot.run_async(handle_signals=False) for bot in bots))
+    finally:
+        engines.shutdown()
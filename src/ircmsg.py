@@ -1,9 +1,110 @@
 import logging
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, List, Optional
 
 log = logging.getLogger()
 
+# IRCv3 tag value escapes
+TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+
+
+class Message:
+    """
+    One parsed IRC line: @tags :nick!user@host COMMAND params :trailing
+    The trailing parameter is the last of params. The parts of the prefix
+    are split on access, most lines are only looked at by command.
+    """
+    __slots__ = ('tags', 'prefix', 'command', 'params')
+
+    def __init__(self, tags: Dict[str, str], prefix: str, command: str,
+                 params: List[str]) -> None:
+        self.tags = tags
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+
+    @property
+    def nick(self) -> str:
+        return self.prefix.partition('@')[0].partition('!')[0]
+
+    @property
+    def user(self) -> str:
+        return self.prefix.partition('@')[0].partition('!')[2]
+
+    @property
+    def host(self) -> str:
+        return self.prefix.partition('@')[2]
+
+    @property
+    def trailing(self) -> str:
+        return self.params[-1] if self.params else ''
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Message):
+            return NotImplemented
+        return all(getattr(self, s) == getattr(other, s)
+                   for s in self.__slots__)
+
+    def __repr__(self) -> str:
+        return 'Message({})'.format(', '.join(
+            f'{s}={getattr(self, s)!r}' for s in self.__slots__))
+
+
+def unescape_tag_value(value: str) -> str:
+    if '\\' not in value:
+        return value
+    chars = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == '\\':
+            i += 1
+            # A lone backslash at the end is dropped
+            if i < len(value):
+                chars.append(TAG_ESCAPES.get(value[i], value[i]))
+        else:
+            chars.append(char)
+        i += 1
+    return ''.join(chars)
+
+
+def parse_tags(raw: str) -> Dict[str, str]:
+    tags = {}
+    for tag in raw.split(';'):
+        if tag:
+            key, _, value = tag.partition('=')
+            tags[key] = unescape_tag_value(value)
+    return tags
+
+
+def parse_line(line: str) -> Optional[Message]:
+    """
+    Parse one line (RFC 1459 with IRCv3 tags) from left to right, return
+    None if it has no command.
+    """
+    tags: Dict[str, str] = {}
+    prefix = ''
+
+    if line.startswith('@'):
+        raw_tags, _, line = line[1:].partition(' ')
+        tags = parse_tags(raw_tags)
+        line = line.lstrip(' ')
+
+    if line.startswith(':'):
+        prefix, _, line = line[1:].partition(' ')
+
+    # Middle params never start with a colon, the first " :" starts the
+    # trailing param
+    head, colon, trailing = line.partition(' :')
+    params = head.split()
+    if not params:
+        return None
+    if colon:
+        params.append(trailing)
+    command = params.pop(0).upper()
+
+    return Message(tags, prefix, command, params)
+
 
 @dataclass
 class IrcMsg:
@@ -12,15 +113,8 @@ class IrcMsg:
     msg: str
 
     @staticmethod
-    def from_raw(raw: str) -> Optional['IrcMsg']:
-        name = raw.split('!', 1)[0][1:]
-        channel = raw.split('PRIVMSG', 1)[1].split()[0]
-
-        try:
-            msg = raw.split('PRIVMSG', 1)[1].split(':', 1)[1]
-        except IndexError as e:
-            # TODO: Use logging.exception or traceback module
-            logging.error(e)
+    def from_message(message: Message) -> Optional['IrcMsg']:
+        # A PRIVMSG has a target and a text
+        if len(message.params) < 2:
             return None
-
-        return IrcMsg(name, channel, msg)
+        return IrcMsg(message.nick, message.params[0], message.params[1])
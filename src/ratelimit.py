@@ -0,0 +1,134 @@
+import collections
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to capacity tokens and refills at rate
+    tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._last = clock()
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def consume(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens if available and return 0.0, otherwise take nothing and
+        return the number of seconds until they will be available.
+        """
+        wait = self.wait_time(tokens)
+        if not wait:
+            self._tokens -= tokens
+        return wait
+
+    def wait_time(self, tokens: float = 1.0) -> float:
+        # Seconds until tokens are available, without taking them
+        self._refill()
+        if self._tokens >= tokens:
+            return 0.0
+        return (tokens - self._tokens) / self._rate
+
+    def force(self, tokens: float = 1.0) -> None:
+        # Take tokens even if that puts the bucket in debt
+        self._refill()
+        self._tokens -= tokens
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self._capacity,
+                           self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+
+class CommandLimiter:
+    """
+    Limits commands with one token bucket per nick and one per command, a
+    command takes cost tokens from both.
+
+    A command that is over budget is deferred by reserving its tokens
+    ahead, as long as it would run within max_delay seconds and the nick
+    has fewer than max_deferred commands waiting. Otherwise it is dropped.
+    """
+
+    def __init__(self, user_rate: float, user_burst: float,
+                 command_rate: float, command_burst: float,
+                 max_delay: float, max_deferred: int = 1,
+                 max_users: int = 1024,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._user_rate = user_rate
+        self._user_burst = user_burst
+        self._command_rate = command_rate
+        self._command_burst = command_burst
+        self._max_delay = max_delay
+        self._max_deferred = max_deferred
+        self._max_users = max_users
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Casefolded nick -> bucket, least recently used first
+        self._users: 'collections.OrderedDict[str, TokenBucket]' = \
+            collections.OrderedDict()
+        self._commands: Dict[str, TokenBucket] = {}
+        self._deferred: Dict[str, int] = {}
+
+    def acquire(self, nick: str, command: str,
+                cost: float = 1.0) -> Optional[float]:
+        """
+        Return 0.0 if the command may run now, the number of seconds to
+        defer it by, or None if it is dropped.
+        """
+        key = nick.casefold()
+        with self._lock:
+            user_bucket = self._user_bucket(key)
+            command_bucket = self._commands.get(command)
+            if command_bucket is None:
+                command_bucket = TokenBucket(
+                    self._command_rate, self._command_burst, self._clock)
+                self._commands[command] = command_bucket
+
+            # Never more than a full bucket, or it could never run
+            user_cost = min(cost, self._user_burst)
+            command_cost = min(cost, self._command_burst)
+            wait = max(user_bucket.wait_time(user_cost),
+                       command_bucket.wait_time(command_cost))
+            if wait:
+                if (wait > self._max_delay or
+                        self._deferred.get(key, 0) >= self._max_deferred):
+                    return None
+                self._deferred[key] = self._deferred.get(key, 0) + 1
+            user_bucket.force(user_cost)
+            command_bucket.force(command_cost)
+            return wait
+
+    def release_deferred(self, nick: str) -> None:
+        # A deferred command of nick is about to run
+        key = nick.casefold()
+        with self._lock:
+            count = self._deferred.get(key, 0) - 1
+            if count > 0:
+                self._deferred[key] = count
+            else:
+                self._deferred.pop(key, None)
+
+    def _user_bucket(self, key: str) -> TokenBucket:
+        bucket = self._users.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self._user_rate, self._user_burst,
+                                 self._clock)
+            self._users[key] = bucket
+            if len(self._users) > self._max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(key)
+        return bucket
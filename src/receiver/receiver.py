@@ -1,16 +1,19 @@
+import asyncio
 import logging
 import os
-import select
-import socket
-from typing import Union, List
+from typing import Optional, List
 
 log = logging.getLogger(__name__)
 
 
 class Receiver:
-    def __init__(self, irc_socket: socket.socket, socket_timeout: int) -> None:
-        self._irc_socket = irc_socket
+    def __init__(self, reader: Optional[asyncio.StreamReader],
+                 socket_timeout: int) -> None:
+        self._reader = reader
         self._socket_timeout = socket_timeout
+        self._chunk_size = 2 ** 16
+        self._max_buffer_size = 2 ** 20
+        self._buffer = bytearray()
 
         try:
             self._tc = int(os.popen('stty size', 'r').read().split()[1])
@@ -19,31 +22,56 @@ class Receiver:
             self._tc = 80
 
     @property
-    def irc_socket(self) -> socket.socket:
-        return self._irc_socket
+    def reader(self) -> Optional[asyncio.StreamReader]:
+        return self._reader
 
-    @irc_socket.setter
-    def irc_socket(self, new_socket: socket.socket) -> None:
-        self._irc_socket = new_socket
+    @reader.setter
+    def reader(self, new_reader: asyncio.StreamReader) -> None:
+        self._reader = new_reader
+        # A partial line of the old connection will never be completed
+        self._buffer.clear()
+
+    async def receive_msg(self) -> List[str]:
+        """
+        Return the complete lines received so far, possibly none.
+        A single empty line signals a timeout or a lost connection.
+        """
+        if self._reader is None:
+            return [""]
 
-    def receive_msg(self) -> Union[str, List[str]]:
         # Timeout when connection is lost
-        self._irc_socket.setblocking(False)
-        ready = select.select([self._irc_socket], [], [], self._socket_timeout)
-        ircmsg = ""
-        if ready[0]:
-            try:
-                ircmsg = self._irc_socket.recv(2048).decode("UTF-8")
-            except (OSError, UnicodeDecodeError) as e:
-                log.error(e)
-                return "ERROR"
-
-        ircmsgs = ircmsg.split('\r\n')
-        if len(ircmsgs) > 1 and not ircmsgs[len(ircmsgs) - 1]:
-            del ircmsgs[len(ircmsgs) - 1]
+        try:
+            data = await asyncio.wait_for(self._reader.read(self._chunk_size),
+                                          self._socket_timeout)
+        except asyncio.TimeoutError:
+            return [""]
+        except OSError as e:
+            log.error(e)
+            return [""]
+        if not data:
+            return [""]
+
+        ircmsgs = self.frame(data)
         sepmsg = "ircmsg:"
         for ircmsg in ircmsgs:
             log.info("%s %s", sepmsg, "-" * (self._tc - len(sepmsg) - 30))
             log.info(ircmsg)
-        self._irc_socket.setblocking(True)
         return ircmsgs
+
+    def frame(self, data: bytes) -> List[str]:
+        # Keep an incomplete trailing line in the buffer for the next read.
+        # Lines are only decoded once complete, so a multibyte character
+        # can never be cut in half; invalid bytes are replaced.
+        self._buffer += data
+        end = self._buffer.rfind(b'\n')
+        if end == -1:
+            if len(self._buffer) > self._max_buffer_size:
+                log.error("Discarding %d bytes without line ending",
+                          len(self._buffer))
+                self._buffer.clear()
+            return []
+
+        lines = self._buffer[:end].split(b'\n')
+        del self._buffer[:end + 1]
+        return [line.rstrip(b'\r').decode("UTF-8", errors="replace")
+                for line in lines if line.rstrip(b'\r')]
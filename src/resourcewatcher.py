@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+from typing import Callable, Dict, FrozenSet, Iterable, NamedTuple, Optional, Set, Tuple
+
+from src.triggermatcher import TriggerMatcher
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None  # type: ignore
+
+log = logging.getLogger(__name__)
+
+
+class ResourceSnapshot(NamedTuple):
+    """
+    Everything derived from the resource files, published as one object
+    so readers never see a mix of old and new data.
+    """
+    responses: Tuple[str, ...]
+    bot_bros: FrozenSet[str]
+    trigger_matcher: TriggerMatcher
+
+
+class ResourceWatcher:
+    """
+    Watches files and calls on_change with the paths that changed, from a
+    background thread. Uses inotify if inotify_simple is installed and
+    falls back to polling mtime and size every poll_interval seconds.
+    """
+
+    def __init__(self, paths: Iterable[str],
+                 on_change: Callable[[Set[str]], None],
+                 poll_interval: float) -> None:
+        self._paths = {os.path.abspath(p) for p in paths}
+        self._on_change = on_change
+        self._poll_interval = poll_interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._inotify: Optional[INotify] = None
+        self._watches: Dict[int, str] = {}
+
+    def start(self) -> None:
+        # Set up before returning, so no change after start() is missed
+        if INotify is not None:
+            self._inotify = INotify()
+            # Watch the directories, editors tend to replace files on save
+            for directory in {os.path.dirname(p) for p in self._paths}:
+                wd = self._inotify.add_watch(directory, flags.CLOSE_WRITE |
+                                             flags.MOVED_TO | flags.CREATE)
+                self._watches[wd] = directory
+            target = self._watch_inotify
+        else:
+            self._signatures = {p: self._signature(p) for p in self._paths}
+            target = self._watch_poll
+        self._thread = threading.Thread(target=target, name='resource-watcher',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _notify(self, changed: Set[str]) -> None:
+        if not changed:
+            return
+        log.info("Resource files changed: %s", sorted(changed))
+        try:
+            self._on_change(changed)
+        except Exception as e:
+            log.error(e)
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _watch_poll(self) -> None:
+        signatures = self._signatures
+        while not self._stopped.wait(self._poll_interval):
+            changed = set()
+            for path in self._paths:
+                signature = self._signature(path)
+                if signature != signatures[path]:
+                    signatures[path] = signature
+                    changed.add(path)
+            self._notify(changed)
+
+    def _watch_inotify(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                events = self._inotify.read(
+                    timeout=int(self._poll_interval * 1000))
+                changed = {os.path.join(self._watches[e.wd], e.name)
+                           for e in events if e.wd in self._watches}
+                self._notify(changed & self._paths)
+        finally:
+            self._inotify.close()
@@ -1,21 +1,144 @@
-import socket
+import asyncio
+import itertools
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Optional, Tuple
 
-import time
+from src.ratelimit import TokenBucket
+from src.sender.splitter import split_message
+
+log = logging.getLogger(__name__)
+
+# Outbound queue priorities, lower is sent first
+PRIORITY_HIGH = 0  # PONG, QUIT
+PRIORITY_NORMAL = 1  # Registration, JOIN
+PRIORITY_LOW = 2  # PRIVMSG, NOTICE, BATCH
+
+QueueItem = Tuple[int, int, bytes, Optional[Future]]
 
 
 class Sender:
-    def __init__(self, irc_socket: socket.socket,
-                 repeated_message_sleep_time: float) -> None:
-        self._irc_socket = irc_socket
+    def __init__(self, writer: Optional[asyncio.StreamWriter],
+                 repeated_message_sleep_time: float,
+                 burst: int = 1) -> None:
+        self._writer = writer
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._urgent: Optional[asyncio.Event] = None
+        # FIFO order within the same priority
+        self._sequence = itertools.count()
+
+        # Server flood protection: a burst of messages, then one message
+        # every repeated_message_sleep_time seconds
         self._repeated_message_sleep_time = repeated_message_sleep_time
+        self._bucket = TokenBucket(rate=1 / repeated_message_sleep_time,
+                                   capacity=burst)
 
     @property
-    def irc_socket(self) -> socket.socket:
-        return self._irc_socket
+    def writer(self) -> Optional[asyncio.StreamWriter]:
+        return self._writer
+
+    @writer.setter
+    def writer(self, new_writer: asyncio.StreamWriter) -> None:
+        # Must be set from within the event loop that owns the writer
+        self.close()
+        self._writer = new_writer
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._queue = asyncio.PriorityQueue()
+        self._urgent = asyncio.Event()
+        self._writer_task = self._loop.create_task(
+            self._write_loop(new_writer, self._queue))
+
+    def close(self) -> None:
+        # Pending messages were meant for the old connection, drop them
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._fail(self._queue.get_nowait())
+            self._queue = None
+            self._urgent = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def enqueue(self, msg: str, priority: int = PRIORITY_LOW,
+                with_future: bool = False) -> Optional[Future]:
+        """
+        Queue a raw IRC line for sending without blocking. Safe to call
+        from any thread. The optional future resolves to the number of
+        bytes written once the line is on the wire.
+        """
+        if self._queue is None or self._loop is None:
+            raise ConnectionError("Sender is not connected")
+        future: Optional[Future] = Future() if with_future else None
+        item = (priority, next(self._sequence), bytes(msg, "UTF-8"), future)
+        if threading.get_ident() == self._loop_thread:
+            self._put(item)
+        else:
+            self._loop.call_soon_threadsafe(self._put, item)
+        return future
+
+    def _put(self, item: QueueItem) -> None:
+        if self._queue is None or self._urgent is None:
+            self._fail(item)
+            return
+        self._queue.put_nowait(item)
+        if item[0] == PRIORITY_HIGH:
+            self._urgent.set()
+
+    async def _write_loop(self, writer: asyncio.StreamWriter,
+                          queue: asyncio.PriorityQueue) -> None:
+        item: Optional[QueueItem] = None
+        try:
+            while True:
+                item = await queue.get()
+                priority, _, data, future = item
+                if priority == PRIORITY_HIGH:
+                    # Never hold back PONG/QUIT, but account for them
+                    self._bucket.force()
+                else:
+                    delay = self._bucket.consume()
+                    if delay > 0:
+                        # Put it back and wait, unless something urgent
+                        # arrives in the meantime
+                        queue.put_nowait(item)
+                        item = None
+                        await self._wait_urgent(delay)
+                        continue
+                writer.write(data)
+                await writer.drain()
+                if future is not None:
+                    future.set_result(len(data))
+                item = None
+        except asyncio.CancelledError:
+            if item is not None:
+                self._fail(item)
+            raise
+        except OSError as e:
+            log.error(e)
+            if item is not None:
+                self._fail(item)
+
+    async def _wait_urgent(self, timeout: float) -> None:
+        if self._urgent is None:
+            return
+        try:
+            await asyncio.wait_for(self._urgent.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._urgent.clear()
 
-    @irc_socket.setter
-    def irc_socket(self, new_socket: socket.socket) -> None:
-        self._irc_socket = new_socket
+    @staticmethod
+    def _fail(item: QueueItem) -> None:
+        future = item[3]
+        if future is not None and not future.done():
+            future.set_exception(ConnectionError("Connection closed"))
 
     def send_privmsg(self, msg: str, target: str, max_message_length: int,
                      notice: bool = False) -> bool:
@@ -24,40 +147,49 @@ class Sender:
         #  already been sent
 
         # Handle sending a message that is longer than the max IRC
-        # message length, i.e. split it up into multiple messages
-        msg_parts = [msg[i:i + max_message_length]
-                     for i in range(0, len(msg), max_message_length)]
+        # message length (in bytes), i.e. split it up into multiple messages
+        msg_parts = split_message(msg, max_message_length)
 
         # NOTICE for private messages without separate buffer
         # PRIVMSG for message to buffer, either nick or channel
         irc_cmd = "NOTICE " if notice else "PRIVMSG "
         separator = " " if notice else " :"
 
+        # Paced by the token bucket of the write loop
         for msg_part in msg_parts:
-            self._irc_socket.send(bytes(irc_cmd + target + separator
-                                        + msg_part + "\n", "UTF-8"))
-            time.sleep(self._repeated_message_sleep_time)
+            self.enqueue(irc_cmd + target + separator + msg_part + "\n")
         return True
 
     def send_auth(self, nick: str, password: str) -> int:
-        self._irc_socket.send(bytes("PASS " + password + "\n", "UTF-8"))
-        self._irc_socket.send(bytes("USER " + nick + " " + nick +
-                                    " " + nick + ":snoobotasmo .\n",
-                                    "UTF-8"))
-        return self._irc_socket.send(bytes("NICK " + nick + "\n", "UTF-8"))
+        msgs = ["PASS " + password + "\n",
+                "USER " + nick + " " + nick + " " + nick + ":snoobotasmo .\n",
+                "NICK " + nick + "\n"]
+        for msg in msgs:
+            self.enqueue(msg, PRIORITY_NORMAL)
+        return len(bytes(msgs[-1], "UTF-8"))
 
     def send_join(self, channel: str) -> int:
-        return self._irc_socket.send(bytes("JOIN " + channel + "\n", "UTF-8"))
+        msg = "JOIN " + channel + "\n"
+        self.enqueue(msg, PRIORITY_NORMAL)
+        return len(bytes(msg, "UTF-8"))
 
-    def send_quit(self) -> int:
-        return self._irc_socket.send(bytes("QUIT \n", "UTF-8"))
+    def send_quit(self, priority: int = PRIORITY_HIGH) -> int:
+        # A lower priority lets already queued messages go out first
+        msg = "QUIT \n"
+        self.enqueue(msg, priority)
+        return len(bytes(msg, "UTF-8"))
 
     def send_pong(self, code: str) -> int:
-        return self._irc_socket.send(bytes('PONG :' + code + '\r\n', "UTF-8"))
+        msg = 'PONG :' + code + '\r\n'
+        self.enqueue(msg, PRIORITY_HIGH)
+        return len(bytes(msg, "UTF-8"))
 
     def send_start_batch(self, channel: str, batch_id: str, batch_type: str) -> int:
-        return self._irc_socket.send(bytes("BATCH +" + batch_id + " " + batch_type +
-                                           " " + channel + "\n", "UTF-8"))
+        msg = "BATCH +" + batch_id + " " + batch_type + " " + channel + "\n"
+        self.enqueue(msg)
+        return len(bytes(msg, "UTF-8"))
 
     def send_end_batch(self, batch_id: str) -> int:
-        return self._irc_socket.send(bytes("BATCH -" + batch_id + "\n", "UTF-8"))
+        msg = "BATCH -" + batch_id + "\n"
+        self.enqueue(msg)
+        return len(bytes(msg, "UTF-8"))
@@ -0,0 +1,56 @@
+import re
+from typing import List
+
+# Units that must never be split: IRC formatting codes (bold, italics,
+# underline, strikethrough, monospace, reverse, reset, color with its
+# optional fore-/background, hex color) or a single code point
+UNIT_RE = re.compile(r'\x03(?:\d{1,2}(?:,\d{1,2})?)?'
+                     r'|\x04(?:[0-9a-fA-F]{6}(?:,[0-9a-fA-F]{6})?)?'
+                     r'|[\x02\x0f\x11\x16\x1d\x1e\x1f]'
+                     r'|.', re.DOTALL)
+
+
+def byte_length(text: str) -> int:
+    return len(text.encode("UTF-8"))
+
+
+def split_message(msg: str, max_bytes: int) -> List[str]:
+    """
+    Split msg into as few parts as possible of at most max_bytes UTF-8
+    bytes each. Parts are broken at spaces where possible, which are
+    dropped; words longer than max_bytes are broken between code points,
+    never inside a character or a formatting code.
+    """
+    if not msg:
+        return []
+    if max_bytes <= 0 or byte_length(msg) <= max_bytes:
+        return [msg]
+
+    parts: List[str] = []
+    current = ""
+    current_bytes = 0
+    for word in msg.split(' '):
+        word_bytes = byte_length(word)
+        # +1 for the separating space
+        if current and current_bytes + 1 + word_bytes <= max_bytes:
+            current += ' ' + word
+            current_bytes += 1 + word_bytes
+            continue
+        if current:
+            parts.append(current)
+            current, current_bytes = "", 0
+        if word_bytes <= max_bytes:
+            current, current_bytes = word, word_bytes
+            continue
+
+        # Word alone does not fit, break it up
+        for unit in UNIT_RE.findall(word):
+            unit_bytes = byte_length(unit)
+            if current_bytes + unit_bytes > max_bytes and current:
+                parts.append(current)
+                current, current_bytes = "", 0
+            current += unit
+            current_bytes += unit_bytes
+    if current:
+        parts.append(current)
+    return parts
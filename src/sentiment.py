@@ -0,0 +1,77 @@
+import collections
+import threading
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from textblob.en import Sentiment
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+
+class SentimentResult(NamedTuple):
+    polarity: float
+    subjectivity: float
+    vader: Dict[str, float]
+
+
+class SentimentService:
+    """
+    Shared sentiment analysis. The analyzers are built once, on first use
+    or in warm_up(), and results for recently seen texts are cached.
+    """
+
+    def __init__(self, cache_size: int = 1024) -> None:
+        self._lock = threading.Lock()
+        self._pattern: Optional['Sentiment'] = None
+        self._vader: Optional['SentimentIntensityAnalyzer'] = None
+        self._cache_size = cache_size
+        self._cache: collections.OrderedDict = collections.OrderedDict()
+
+    def warm_up(self) -> None:
+        self.analyze("warm up")
+
+    def analyze(self, text: str) -> SentimentResult:
+        return self.analyze_batch([text])[0]
+
+    def analyze_batch(self, texts: List[str]) -> List[SentimentResult]:
+        """
+        Score texts with one set of analyzers, skipping cached and
+        duplicate texts. Neither library scores several texts in one call,
+        so the rest are scored one by one.
+        """
+        results: Dict[str, SentimentResult] = {}
+        with self._lock:
+            for text in texts:
+                if text in self._cache:
+                    self._cache.move_to_end(text)
+                    results[text] = self._cache[text]
+        missing = [t for t in dict.fromkeys(texts) if t not in results]
+
+        if missing:
+            pattern, vader = self._analyzers()
+            for text in missing:
+                # What TextBlob(text).sentiment returns, without building
+                # a namedtuple class per call
+                polarity, subjectivity = pattern(text)
+                results[text] = SentimentResult(
+                    polarity, subjectivity, vader.polarity_scores(text))
+
+            with self._lock:
+                for text in missing:
+                    self._cache[text] = results[text]
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+        return [results[t] for t in texts]
+
+    def _analyzers(self) -> Tuple['Sentiment', 'SentimentIntensityAnalyzer']:
+        with self._lock:
+            if self._pattern is None or self._vader is None:
+                # Imported here, textblob pulls in nltk
+                from textblob.en import sentiment
+                from vaderSentiment.vaderSentiment import \
+                    SentimentIntensityAnalyzer
+                # Loads the lexicons from disk
+                sentiment.load()
+                self._pattern = sentiment
+                self._vader = SentimentIntensityAnalyzer()
+            return self._pattern, self._vader
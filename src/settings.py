@@ -4,6 +4,7 @@ from typing import Dict
 CONFIG: Dict[str, str] = dict()
 
 CONFIG['server'] = os.environ.get("SERVER", "")
+CONFIG['port'] = os.environ.get("PORT", "6667")
 CONFIG['channel'] = os.environ.get("CHANNEL", "")
 CONFIG['bot_nick'] = os.environ.get("BOT_NICK", "")
 CONFIG['password'] = os.environ.get("PASSWORD", "")
@@ -11,11 +12,64 @@ CONFIG['admin_name'] = os.environ.get("ADMIN_NAME", "")
 CONFIG['exit_code'] = os.environ.get("EXIT_CODE", "")
 CONFIG['command_prefix'] = os.environ.get("COMMAND_PREFIX", "")
 CONFIG['user_db_message_log_size'] = os.environ.get("USER_DB_MESSAGE_LOG_SIZE", "1000")
+CONFIG['user_db_backend'] = os.environ.get("USER_DB_BACKEND", "sqlite")
+CONFIG['user_db_flush_interval'] = os.environ.get("USER_DB_FLUSH_INTERVAL", "5")
+CONFIG['user_db_flush_size'] = os.environ.get("USER_DB_FLUSH_SIZE", "500")
+CONFIG['user_db_resident_users'] = os.environ.get("USER_DB_RESIDENT_USERS", "256")
+# Older messages kept per user in compressed segments, 0 to delete them
+CONFIG['user_db_archive_size'] = os.environ.get("USER_DB_ARCHIVE_SIZE", "0")
+CONFIG['user_db_archive_segment_size'] = os.environ.get("USER_DB_ARCHIVE_SEGMENT_SIZE", "500")
+# One segment file pair per CHANNEL_LOG_SEGMENT_SECONDS
+CONFIG['channel_log_segment_seconds'] = os.environ.get("CHANNEL_LOG_SEGMENT_SECONDS", "3600")
+CONFIG['channel_log_max_segments'] = os.environ.get("CHANNEL_LOG_MAX_SEGMENTS", "168")
+CONFIG['send_interval'] = os.environ.get("SEND_INTERVAL", "1.25")
+CONFIG['send_burst'] = os.environ.get("SEND_BURST", "4")
+CONFIG['command_modules'] = os.environ.get("COMMAND_MODULES", "src.command")
+CONFIG['command_aliases'] = os.environ.get("COMMAND_ALIASES", "lm=lastmessage,wc=wordcloud")
+CONFIG['disabled_commands'] = os.environ.get("DISABLED_COMMANDS", "")
+CONFIG['command_user_rate'] = os.environ.get("COMMAND_USER_RATE", "0.5")
+CONFIG['command_user_burst'] = os.environ.get("COMMAND_USER_BURST", "10")
+CONFIG['command_rate'] = os.environ.get("COMMAND_RATE", "1")
+CONFIG['command_burst'] = os.environ.get("COMMAND_BURST", "10")
+CONFIG['command_max_delay'] = os.environ.get("COMMAND_MAX_DELAY", "30")
 CONFIG['stopwords'] = os.environ.get("STOPWORDS", "")
+CONFIG['wordcloud_workers'] = os.environ.get("WORDCLOUD_WORKERS", "1")
+CONFIG['wordcloud_max_jobs'] = os.environ.get("WORDCLOUD_MAX_JOBS", "4")
+CONFIG['wordcloud_timeout'] = os.environ.get("WORDCLOUD_TIMEOUT", "300")
+CONFIG['wordcloud_cache_size'] = os.environ.get("WORDCLOUD_CACHE_SIZE", "64")
+CONFIG['wordcloud_cache_ttl'] = os.environ.get("WORDCLOUD_CACHE_TTL", "3600")
+# 1 to load everything heavy at start instead of on first use
+CONFIG['warm_up'] = os.environ.get("WARM_UP", "0")
 CONFIG['imgur_client_id'] = os.environ.get("IMGUR_CLIENT_ID", "")
 CONFIG['imgur_client_secret'] = os.environ.get("IMGUR_CLIENT_SECRET", "")
+# Further networks served by the same process, see get_network_config
+CONFIG['networks'] = os.environ.get("NETWORKS", "")
+
+# May be left empty
+OPTIONAL = {'disabled_commands', 'networks'}
+
+# Settings a network can override with <NETWORK>_<SETTING>
+NETWORK_SETTINGS = ['server', 'port', 'channel', 'bot_nick', 'password',
+                    'admin_name', 'exit_code', 'command_prefix',
+                    'send_interval', 'send_burst']
+
+
+def get_network_config(network: str) -> Dict[str, str]:
+    """
+    CONFIG with the overrides of a network, e.g. LIBERA_SERVER and
+    LIBERA_CHANNEL for the network libera.
+    """
+    config = dict(CONFIG)
+    prefix = network.upper().replace('-', '_') + '_'
+    for key in NETWORK_SETTINGS:
+        value = os.environ.get(prefix + key.upper())
+        if value is not None:
+            config[key] = value
+    return config
+
 
 if "CI" not in os.environ:
-    empties = [v[0] for v in CONFIG.items() if v[1] == ""]
+    empties = [v[0] for v in CONFIG.items()
+               if v[1] == "" and v[0] not in OPTIONAL]
     if empties:
         raise EnvironmentError(f"Unset environment variables: {empties}")
@@ -0,0 +1,68 @@
+import collections
+from typing import Dict, List
+
+
+class TriggerMatcher:
+    """
+    Aho-Corasick automaton over the trigger keys, so a message is scanned
+    once for all keys instead of once per key.
+    """
+
+    def __init__(self, triggers: Dict[str, List]) -> None:
+        self._triggers = triggers
+        self._keys = list(triggers.keys())
+
+        # Trie: goto transitions, failure links and the indices of the
+        # keys that end in each state (including via failure links)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for index, key in enumerate(self._keys):
+            if not key:
+                continue
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(index)
+
+        # Breadth first, so failure links always point to finished states
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._out[next_state] = self._out[next_state] + self._out[fail]
+
+    @property
+    def triggers(self) -> Dict[str, List]:
+        return self._triggers
+
+    def find_all(self, text: str) -> List[str]:
+        """
+        Return all keys contained in text, in the order of the trigger table.
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return [self._keys[index] for index in sorted(found)]
@@ -0,0 +1,119 @@
+import os
+import threading
+import zlib
+from typing import Callable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+
+def compress(data: bytes, extension: str) -> bytes:
+    if extension == 'zst':
+        return zstandard.ZstdCompressor().compress(data)
+    return zlib.compress(data)
+
+
+def decompress(data: bytes, extension: str) -> bytes:
+    if extension == 'zst':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class MessageArchive:
+    """
+    Cold message history: older messages of each user in compressed
+    segment files, one directory per user. Compressed with zstd if
+    zstandard is installed, with zlib otherwise.
+
+    At most max_messages are kept per user, the oldest segments are
+    deleted first and on_expire is called with the user's name.
+    """
+
+    def __init__(self, directory: str, segment_size: int, max_messages: int,
+                 on_expire: Optional[Callable[[str], None]] = None) -> None:
+        self._directory = directory
+        self._segment_size = segment_size
+        self._max_messages = max_messages
+        self._on_expire = on_expire
+        self._extension = 'zst' if zstandard is not None else 'zlib'
+        self._lock = threading.Lock()
+
+    @property
+    def segment_size(self) -> int:
+        return self._segment_size
+
+    @property
+    def max_messages(self) -> int:
+        return self._max_messages
+
+    def _user_dir(self, name: str) -> str:
+        # Nicks may hold characters that are not allowed in file names
+        return os.path.join(self._directory, name.encode().hex())
+
+    def _segments(self, user_dir: str) -> List[Tuple[str, int]]:
+        """
+        Segment files of a user oldest first, with their message counts.
+        """
+        try:
+            files = os.listdir(user_dir)
+        except FileNotFoundError:
+            return []
+        segments = []
+        # <first message id>-<message count>.<extension>
+        for file_name in sorted(files):
+            stem, _, extension = file_name.partition('.')
+            if extension in ('zst', 'zlib'):
+                count = int(stem.split('-')[1])
+                segments.append((os.path.join(user_dir, file_name), count))
+        return segments
+
+    def write_segment(self, name: str, first_id: int,
+                      messages: List[str]) -> None:
+        user_dir = self._user_dir(name)
+        os.makedirs(user_dir, exist_ok=True)
+        path = os.path.join(user_dir, f'{first_id:012d}-{len(messages)}.'
+                                      f'{self._extension}')
+        data = compress('\n'.join(messages).encode(), self._extension)
+        # Never leave a half written segment behind. Writing the same
+        # segment again after a crash replaces it
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            segments = self._segments(user_dir)
+            total = sum(count for _, count in segments)
+            expired = False
+            while segments and total > self._max_messages:
+                path, count = segments.pop(0)
+                os.remove(path)
+                total -= count
+                expired = True
+        if expired and self._on_expire is not None:
+            self._on_expire(name)
+
+    def iter_messages(self, name: str) -> Iterator[str]:
+        """
+        Messages of a user oldest first, decompressing one segment at a
+        time. The segments are listed right away, segments written later
+        are not included.
+        """
+        return self._read_segments(self._segments(self._user_dir(name)))
+
+    @staticmethod
+    def _read_segments(segments: List[Tuple[str, int]]) -> Iterator[str]:
+        for path, _ in segments:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # Expired meanwhile
+                continue
+            extension = path.rpartition('.')[2]
+            yield from decompress(data, extension).decode().split('\n')
+
+    def message_count(self, name: str) -> int:
+        return sum(count for _, count in self._segments(self._user_dir(name)))
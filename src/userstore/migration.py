@@ -0,0 +1,29 @@
+import logging
+import os
+
+from src.userstore.tinydbuserstore import TinyDBUserStore
+from src.userstore.userstore import UserStore
+
+log = logging.getLogger(__name__)
+
+
+def migrate_tinydb_users(json_path: str, store: UserStore) -> int:
+    """
+    One-shot import of a legacy TinyDB users.json into store.
+
+    The JSON file is renamed afterwards so the migration does not run twice.
+    Returns the number of imported users.
+    """
+    if not os.path.isfile(json_path):
+        return 0
+
+    legacy_store = TinyDBUserStore(json_path, store.message_log_size)
+    users = legacy_store.all()
+    legacy_store.close()
+
+    for user in users:
+        store.import_user(user)
+
+    os.replace(json_path, json_path + '.migrated')
+    log.info("Migrated %d users from %s", len(users), json_path)
+    return len(users)
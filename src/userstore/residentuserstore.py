@@ -0,0 +1,172 @@
+import collections
+import sys
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from src.userstore.userstore import UserStore
+
+
+class MessageLog:
+    """
+    The last size messages of a user, as UTF-8 in one buffer with an array
+    of end offsets instead of one str object per message.
+
+    Appending is amortized O(1): messages that fell off stay in the buffer
+    until there are a quarter of size of them, then they are cut off in
+    one go.
+    """
+    __slots__ = ('_size', '_data', '_ends', '_first')
+
+    def __init__(self, size: int, messages: Iterable[str] = ()) -> None:
+        self._size = size
+        self._data = bytearray()
+        self._ends = array('Q')
+        # Index of the oldest message still in the log
+        self._first = 0
+        for message in messages:
+            self.append(message)
+
+    def append(self, message: str) -> None:
+        self._data += message.encode()
+        self._ends.append(len(self._data))
+        if len(self._ends) - self._first > self._size:
+            self._first += 1
+            if self._first * 4 >= self._size:
+                self._compact()
+
+    def _compact(self) -> None:
+        cut = self._ends[self._first - 1]
+        del self._data[:cut]
+        self._ends = array('Q', (end - cut for end in
+                                 self._ends[self._first:]))
+        self._first = 0
+
+    def __len__(self) -> int:
+        return len(self._ends) - self._first
+
+    def __iter__(self) -> Iterator[str]:
+        data, ends = self._data, self._ends
+        start = ends[self._first - 1] if self._first else 0
+        for i in range(self._first, len(ends)):
+            yield data[start:ends[i]].decode()
+            start = ends[i]
+
+    @property
+    def nbytes(self) -> int:
+        return (sys.getsizeof(self) + sys.getsizeof(self._data) +
+                sys.getsizeof(self._ends))
+
+
+class ResidentUser:
+    __slots__ = ('lastseen', 'lastmessage', 'messages')
+
+    def __init__(self, lastseen: float, lastmessage: str,
+                 messages: MessageLog) -> None:
+        self.lastseen = lastseen
+        self.lastmessage = lastmessage
+        self.messages = messages
+
+
+class ResidentUserStore(UserStore):
+    """
+    Keeps the message logs of recently read users in memory and passes
+    every update on to the wrapped backend, which persists it.
+
+    A user becomes resident on the first read and is kept up to date by
+    appending from then on; at most max_users are kept.
+    """
+
+    def __init__(self, backend: UserStore, max_users: int) -> None:
+        super().__init__(backend.message_log_size)
+        self._backend = backend
+        self._max_users = max_users
+        # Held while a message goes to the backend and here. Logs are
+        # loaded outside of it and only kept if no message was added
+        # meanwhile, so they are never missing one or have it twice
+        self._lock = threading.RLock()
+        self._writes = 0
+        self._users: 'collections.OrderedDict[str, ResidentUser]' = \
+            collections.OrderedDict()
+
+    @property
+    def backend(self) -> UserStore:
+        return self._backend
+
+    @property
+    def history_size(self) -> int:
+        return self._backend.history_size
+
+    def get(self, name: str) -> Optional[Dict]:
+        for _ in range(3):
+            with self._lock:
+                user = self._users.get(name)
+                if user is not None:
+                    self._users.move_to_end(name)
+                    return self._as_dict(name, user)
+                writes = self._writes
+
+            # The backend may have to wait for a flush, don't block
+            # writers and other readers meanwhile
+            stored = self._backend.get(name)
+            if stored is None:
+                return None
+
+            with self._lock:
+                if name in self._users or self._writes != writes:
+                    continue
+                user = ResidentUser(
+                    stored['lastseen'], stored['lastmessage'],
+                    MessageLog(self.message_log_size, stored['messages']))
+                self._users[name] = user
+                if len(self._users) > self._max_users:
+                    self._users.popitem(last=False)
+                return self._as_dict(name, user)
+        # Busy channel, answer from the backend without making it resident
+        return stored
+
+    def add_message(self, name: str, message: str, timestamp: float) -> None:
+        with self._lock:
+            self._backend.add_message(name, message, timestamp)
+            self._writes += 1
+            user = self._users.get(name)
+            if user is not None:
+                user.lastseen = timestamp
+                user.lastmessage = message
+                user.messages.append(message)
+
+    def iter_messages(self, name: str) -> Iterator[str]:
+        # Older messages are never resident
+        return self._backend.iter_messages(name)
+
+    def names(self) -> List[str]:
+        return self._backend.names()
+
+    def import_user(self, user: Dict) -> None:
+        with self._lock:
+            self._users.pop(user['name'], None)
+            self._backend.import_user(user)
+            self._writes += 1
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Bytes held by the resident message logs.
+        """
+        with self._lock:
+            sizes = [u.messages.nbytes for u in self._users.values()]
+        return {'users': len(sizes),
+                'bytes': sum(sizes),
+                'max_bytes_per_user': max(sizes, default=0)}
+
+    def flush(self) -> None:
+        self._backend.flush()
+
+    def close(self) -> None:
+        self._backend.close()
+
+    @staticmethod
+    def _as_dict(name: str, user: ResidentUser) -> Dict:
+        return {'name': name,
+                'lastseen': user.lastseen,
+                'lastmessage': user.lastmessage,
+                'messages': list(user.messages)}
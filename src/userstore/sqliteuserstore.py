@@ -0,0 +1,173 @@
+import itertools
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from src.userstore.messagearchive import MessageArchive
+from src.userstore.userstore import UserStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    lastseen REAL NOT NULL,
+    lastmessage TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_user_id ON messages (user_id, id);
+"""
+
+
+class SqliteUserStore(UserStore):
+    """
+    SQLite backend in WAL mode. A message costs one row insert and an
+    indexed trim of the user's oldest rows instead of a rewrite of the
+    whole database.
+
+    With an archive, rows older than the newest message_log_size are
+    moved there a segment at a time instead of being deleted.
+    """
+
+    def __init__(self, path: str, message_log_size: int,
+                 archive: Optional[MessageArchive] = None) -> None:
+        super().__init__(message_log_size)
+        self._archive = archive
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        # Name index, user name -> row id, in insertion order
+        self._ids: Dict[str, int] = {
+            name: user_id for user_id, name in
+            self._conn.execute("SELECT id, name FROM users ORDER BY id")}
+
+    @property
+    def history_size(self) -> int:
+        if self._archive is None:
+            return self.message_log_size
+        return self.message_log_size + self._archive.max_messages
+
+    def is_empty(self) -> bool:
+        return not self._ids
+
+    def get(self, name: str) -> Optional[Dict]:
+        with self._lock:
+            user_id = self._ids.get(name)
+            if user_id is None:
+                return None
+            lastseen, lastmessage = self._conn.execute(
+                "SELECT lastseen, lastmessage FROM users WHERE id = ?",
+                (user_id,)).fetchone()
+            messages = self._hot_messages(user_id, self.message_log_size)
+        return {'name': name,
+                'lastseen': lastseen,
+                'lastmessage': lastmessage,
+                'messages': messages}
+
+    def iter_messages(self, name: str) -> Iterator[str]:
+        with self._lock:
+            user_id = self._ids.get(name)
+            if user_id is None:
+                return iter(())
+            # Both read under the lock, so no segment is rolled in between
+            messages = self._hot_messages(user_id)
+            if self._archive is None:
+                return iter(messages)
+            archived = self._archive.iter_messages(name)
+        return itertools.chain(archived, messages)
+
+    def add_message(self, name: str, message: str, timestamp: float) -> None:
+        with self._lock, self._conn:
+            user_id = self._upsert_user(name, message, timestamp)
+            self._conn.execute(
+                "INSERT INTO messages (user_id, message) VALUES (?, ?)",
+                (user_id, message))
+            self._trim(user_id, name)
+
+    def add_messages(self, name: str, messages: List[str],
+                     timestamp: float) -> None:
+        if not messages:
+            return
+        with self._lock, self._conn:
+            user_id = self._upsert_user(name, messages[-1], timestamp)
+            self._conn.executemany(
+                "INSERT INTO messages (user_id, message) VALUES (?, ?)",
+                [(user_id, m) for m in messages[-self.history_size:]])
+            self._trim(user_id, name)
+
+    def import_user(self, user: Dict) -> None:
+        with self._lock, self._conn:
+            user_id = self._upsert_user(user['name'], user['lastmessage'],
+                                        user['lastseen'])
+            self._conn.executemany(
+                "INSERT INTO messages (user_id, message) VALUES (?, ?)",
+                [(user_id, m) for m in
+                 user['messages'][-self.history_size:]])
+            self._trim(user_id, user['name'])
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._ids)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _upsert_user(self, name: str, lastmessage: str,
+                     lastseen: float) -> int:
+        user_id = self._ids.get(name)
+        if user_id is None:
+            cursor = self._conn.execute(
+                "INSERT INTO users (name, lastseen, lastmessage) "
+                "VALUES (?, ?, ?)", (name, lastseen, lastmessage))
+            user_id = cursor.lastrowid
+            self._ids[name] = user_id
+        else:
+            self._conn.execute(
+                "UPDATE users SET lastseen = ?, lastmessage = ? WHERE id = ?",
+                (lastseen, lastmessage, user_id))
+        return user_id
+
+    def _hot_messages(self, user_id: int,
+                      limit: Optional[int] = None) -> List[str]:
+        rows = self._conn.execute(
+            "SELECT message FROM messages WHERE user_id = ? "
+            "ORDER BY id DESC LIMIT ?", (user_id, -1 if limit is None
+                                         else limit)).fetchall()
+        return [m for (m,) in reversed(rows)]
+
+    def _trim(self, user_id: int, name: str) -> None:
+        if self._archive is not None:
+            self._roll(user_id, name)
+            return
+        # Drop everything older than the newest message_log_size rows
+        self._conn.execute(
+            "DELETE FROM messages WHERE user_id = ? AND id <= ("
+            "SELECT id FROM messages WHERE user_id = ? "
+            "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (user_id, user_id, self.message_log_size))
+
+    def _roll(self, user_id: int, name: str) -> None:
+        # Move the oldest rows to the archive once a whole segment of them
+        # is past the newest message_log_size. The segment is written
+        # before the rows are deleted, after a crash it is written again
+        segment_size = self._archive.segment_size  # type: ignore
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM messages WHERE user_id = ?",
+            (user_id,)).fetchone()
+        while count >= self.message_log_size + segment_size:
+            rows = self._conn.execute(
+                "SELECT id, message FROM messages WHERE user_id = ? "
+                "ORDER BY id LIMIT ?", (user_id, segment_size)).fetchall()
+            self._archive.write_segment(  # type: ignore
+                name, rows[0][0], [m for _, m in rows])
+            self._conn.execute(
+                "DELETE FROM messages WHERE user_id = ? AND id <= ?",
+                (user_id, rows[-1][0]))
+            count -= len(rows)
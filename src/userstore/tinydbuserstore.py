@@ -0,0 +1,53 @@
+import collections
+from typing import Dict, List, Optional
+
+from tinydb import TinyDB, Query
+
+from src.userstore.userstore import UserStore
+
+
+class TinyDBUserStore(UserStore):
+    """
+    Legacy backend, one JSON document that is rewritten on every message.
+    """
+
+    def __init__(self, path: str, message_log_size: int) -> None:
+        super().__init__(message_log_size)
+        self._db = TinyDB(path)
+
+    def get(self, name: str) -> Optional[Dict]:
+        user_q = Query()
+        return self._db.get(user_q.name == name)
+
+    def add_message(self, name: str, message: str, timestamp: float) -> None:
+        self.add_messages(name, [message], timestamp)
+
+    def add_messages(self, name: str, messages: List[str],
+                     timestamp: float) -> None:
+        if not messages:
+            return
+        user_q = Query()
+        user_q_res = self._db.get(user_q.name == name)
+        if not user_q_res:
+            msgs: collections.deque = collections.deque(messages, maxlen=self.message_log_size)
+            self._db.insert({'name': name,
+                             'lastseen': timestamp,
+                             'lastmessage': messages[-1],
+                             'messages': list(msgs)})
+        else:
+            msgs = collections.deque(user_q_res['messages'],
+                                     maxlen=self.message_log_size)
+            msgs.extend(messages)
+            self._db.update({'lastseen': timestamp,
+                             'lastmessage': messages[-1],
+                             'messages': list(msgs)
+                             }, user_q.name == name)
+
+    def names(self) -> List[str]:
+        return [user['name'] for user in self._db.all()]
+
+    def all(self) -> List[Dict]:
+        return self._db.all()
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,73 @@
+import bisect
+import difflib
+import threading
+from typing import Dict, Iterable, List, Optional
+
+
+class UserIndex:
+    """
+    Case-insensitive index of known nicks.
+
+    Exact lookups go through a dict of casefolded nicks, prefix and fuzzy
+    lookups through a sorted list of them, so no lookup scans every user
+    or interprets the query as a regex.
+    """
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._lock = threading.Lock()
+        # Casefolded nick -> nick as first seen
+        self._names: Dict[str, str] = {}
+        self._sorted_keys: List[str] = []
+        for name in names:
+            self.add(name)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and name.casefold() in self._names
+
+    def add(self, name: str) -> None:
+        key = name.casefold()
+        if key in self._names:
+            return
+        with self._lock:
+            if key not in self._names:
+                self._names[key] = name
+                bisect.insort(self._sorted_keys, key)
+
+    def get(self, query: str) -> Optional[str]:
+        return self._names.get(query.casefold())
+
+    def prefix_matches(self, query: str, limit: int = 10) -> List[str]:
+        key = query.casefold()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted_keys, key)
+            keys = self._sorted_keys[start:start + limit]
+        return [self._names[k] for k in keys if k.startswith(key)]
+
+    def fuzzy_matches(self, query: str, limit: int = 3,
+                      cutoff: float = 0.75) -> List[str]:
+        # Only compare against nicks sharing the first character,
+        # a contiguous slice of the sorted keys
+        key = query.casefold()
+        if not key:
+            return []
+        with self._lock:
+            start = bisect.bisect_left(self._sorted_keys, key[0])
+            end = bisect.bisect_left(self._sorted_keys,
+                                     chr(ord(key[0]) + 1))
+            candidates = self._sorted_keys[start:end]
+        return [self._names[k] for k in
+                difflib.get_close_matches(key, candidates, limit, cutoff)]
+
+    def find(self, query: str, prefix: bool = True,
+             fuzzy: bool = False) -> Optional[str]:
+        name = self.get(query)
+        if name is None and prefix:
+            matches = self.prefix_matches(query, limit=1)
+            name = matches[0] if matches else None
+        if name is None and fuzzy:
+            matches = self.fuzzy_matches(query, limit=1)
+            name = matches[0] if matches else None
+        return name
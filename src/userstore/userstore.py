@@ -0,0 +1,62 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Optional
+
+
+class UserStore(ABC):
+    """
+    Persistent storage of the users the bot has seen.
+
+    A user record is a dict with the keys 'name', 'lastseen',
+    'lastmessage' and 'messages', the latter holding at most
+    message_log_size of the user's most recent messages, oldest first.
+    Backends with an archive keep older messages too, iter_messages
+    streams all of them.
+    """
+
+    def __init__(self, message_log_size: int) -> None:
+        self._message_log_size = message_log_size
+
+    @property
+    def message_log_size(self) -> int:
+        return self._message_log_size
+
+    @property
+    def history_size(self) -> int:
+        """
+        Messages kept per user, archived ones included.
+        """
+        return self._message_log_size
+
+    @abstractmethod
+    def get(self, name: str) -> Optional[Dict]:
+        pass
+
+    @abstractmethod
+    def add_message(self, name: str, message: str, timestamp: float) -> None:
+        pass
+
+    def add_messages(self, name: str, messages: List[str],
+                     timestamp: float) -> None:
+        # Default implementation for backends without a batch path
+        for message in messages:
+            self.add_message(name, message, timestamp)
+
+    def iter_messages(self, name: str) -> Iterator[str]:
+        # Default implementation for backends without an archive
+        user = self.get(name)
+        return iter(user['messages'] if user else ())
+
+    @abstractmethod
+    def names(self) -> List[str]:
+        pass
+
+    def import_user(self, user: Dict) -> None:
+        # Default implementation for backends without a bulk path
+        for message in user['messages']:
+            self.add_message(user['name'], message, user['lastseen'])
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,154 @@
+import itertools
+import logging
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from src.userstore.userstore import UserStore
+
+log = logging.getLogger(__name__)
+
+
+class PendingUser:
+    __slots__ = ('lastseen', 'lastmessage', 'messages')
+
+    def __init__(self) -> None:
+        self.lastseen = 0.0
+        self.lastmessage = ""
+        self.messages: List[str] = []
+
+
+class WriteBehindUserStore(UserStore):
+    """
+    Buffers user updates in memory and writes them to the wrapped backend
+    from a background thread, coalesced per nick.
+
+    A flush happens every flush_interval seconds, or earlier once
+    flush_size messages are pending. Reads see pending updates. A batch
+    the backend fails to write is kept pending for the next flush.
+    """
+
+    def __init__(self, backend: UserStore, flush_interval: float,
+                 flush_size: int) -> None:
+        super().__init__(backend.message_log_size)
+        self._backend = backend
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[str, PendingUser] = {}
+        self._pending_count = 0
+
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop,
+                                         name='user-db-flusher', daemon=True)
+        self._flusher.start()
+
+    @property
+    def backend(self) -> UserStore:
+        return self._backend
+
+    @property
+    def history_size(self) -> int:
+        return self._backend.history_size
+
+    def get(self, name: str) -> Optional[Dict]:
+        # Hold off a concurrent flush so no batch is seen twice
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending.get(name)
+                if pending is not None:
+                    snapshot = (pending.lastseen, pending.lastmessage,
+                                list(pending.messages))
+            user = self._backend.get(name)
+        if pending is None:
+            return user
+
+        # Layer the unwritten messages on top of the stored ones
+        lastseen, lastmessage, messages = snapshot
+        if user:
+            messages[:0] = user['messages']
+        return {'name': name,
+                'lastseen': lastseen,
+                'lastmessage': lastmessage,
+                'messages': messages[-self.message_log_size:]}
+
+    def add_message(self, name: str, message: str, timestamp: float) -> None:
+        with self._lock:
+            pending = self._pending.get(name)
+            if pending is None:
+                pending = self._pending[name] = PendingUser()
+            pending.lastseen = timestamp
+            pending.lastmessage = message
+            pending.messages.append(message)
+            # Only the newest messages of a nick can survive anyway
+            if len(pending.messages) > self.history_size:
+                del pending.messages[0]
+            else:
+                self._pending_count += 1
+            if self._pending_count >= self._flush_size:
+                self._wakeup.set()
+
+    def iter_messages(self, name: str) -> Iterator[str]:
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending.get(name)
+                messages = list(pending.messages) if pending else []
+            stored = self._backend.iter_messages(name)
+        return itertools.chain(stored, messages)
+
+    def names(self) -> List[str]:
+        with self._flush_lock:
+            names = self._backend.names()
+            with self._lock:
+                known = set(names)
+                names.extend(n for n in self._pending if n not in known)
+        return names
+
+    def import_user(self, user: Dict) -> None:
+        self.flush()
+        self._backend.import_user(user)
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._pending_count = 0
+            try:
+                for name, pending in list(batch.items()):
+                    self._backend.add_messages(name, pending.messages,
+                                               pending.lastseen)
+                    del batch[name]
+            except Exception:
+                self._requeue(batch)
+                raise
+
+    def _requeue(self, batch: Dict[str, PendingUser]) -> None:
+        # Put the unwritten users back, before anything added since
+        with self._lock:
+            for name, failed in batch.items():
+                pending = self._pending.get(name)
+                if pending is None:
+                    self._pending[name] = failed
+                    continue
+                messages = failed.messages + pending.messages
+                pending.messages = messages[-self.history_size:]
+            self._pending_count = sum(len(p.messages)
+                                      for p in self._pending.values())
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+        self._flusher.join()
+        self.flush()
+        self._backend.close()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("User db flush failed, retrying later: %s", e)
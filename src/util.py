@@ -1,12 +1,21 @@
-from typing import Set
-
-from sklearn.feature_extraction import text
-from wordcloud import STOPWORDS as WCSTOPWORDS
+import functools
+from typing import AbstractSet, Any, FrozenSet, Iterable, Iterator, List, Set
 
 from src.settings import CONFIG
 
 
-def get_stopwords() -> Set[str]:
+def split_config(value: str) -> List[str]:
+    """
+    Items of a comma separated setting, without blanks.
+    """
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+@functools.lru_cache(maxsize=None)
+def get_stopwords() -> FrozenSet[str]:
+    # Imported here, both pull in numpy and more
+    from sklearn.feature_extraction import text
+    from wordcloud import STOPWORDS as WCSTOPWORDS
 
     stopwords: Set[str] = set()
 
@@ -33,7 +42,32 @@ def get_stopwords() -> Set[str]:
 
     stopwords.update(preprocessed_stopwords)
 
-    return stopwords
+    return frozenset(stopwords)
+
+
+class Stopwords(AbstractSet[str]):
+    """
+    A base set of stop words plus a few more, without copying the base.
+    """
+    __slots__ = ('_base', '_extra')
+
+    def __init__(self, base: AbstractSet[str], extra: Iterable[str]) -> None:
+        self._base = base
+        self._extra = frozenset(extra) - base
+
+    def __contains__(self, word: object) -> bool:
+        return word in self._extra or word in self._base
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._base
+        yield from self._extra
+
+    def __len__(self) -> int:
+        return len(self._base) + len(self._extra)
 
 
-STOPWORDS = get_stopwords()
+def __getattr__(name: str) -> Any:
+    # STOPWORDS never changes, extend it with Stopwords. Built on first use
+    if name == 'STOPWORDS':
+        return get_stopwords()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
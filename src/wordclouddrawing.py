@@ -0,0 +1,64 @@
+import functools
+from pathlib import Path
+from typing import AbstractSet, NamedTuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from wordcloud import WordCloud, ImageColorGenerator
+from wordcloud.wordcloud import FONT_PATH
+
+MASK_CACHE_SIZE = 8
+
+TITLE_FONT_SIZE = 48
+TITLE_PADDING = 16
+
+
+class Mask(NamedTuple):
+    # Read-only, shared by every cloud drawn with this mask
+    array: np.ndarray
+    colors: ImageColorGenerator
+
+
+def load_mask(path: Path) -> Mask:
+    stat = path.stat()
+    # A replaced image gets a new cache entry
+    return _load_mask(str(path), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=MASK_CACHE_SIZE)
+def _load_mask(path: str, mtime_ns: int, size: int) -> Mask:
+    array = np.array(Image.open(path))
+    array.setflags(write=False)
+    return Mask(array, ImageColorGenerator(array))
+
+
+def draw_wordcloud(name: str, user_text: str, stopwords: AbstractSet[str],
+                   use_title: bool, mask_path: Path) -> Image.Image:
+    mask = load_mask(mask_path)
+
+    # Generate wordcloud
+    wc = WordCloud(stopwords=stopwords,
+                   background_color="white",
+                   mask=mask.array,
+                   # mode="RGBA",
+                   max_words=5000,
+                   # max_font_size=40
+                   )
+    wc.generate(user_text.lower())
+
+    # Color with the colormap of the mask image
+    image = wc.recolor(color_func=mask.colors).to_image()
+    if not use_title:
+        return image
+
+    # Put the title in a white band above the cloud
+    title = "Wordcloud for " + name
+    font = ImageFont.truetype(FONT_PATH, TITLE_FONT_SIZE)
+    left, top, right, bottom = font.getbbox(title)
+    band = (bottom - top) + 2 * TITLE_PADDING
+    titled = Image.new("RGB", (image.width, image.height + band), "white")
+    titled.paste(image, (0, band))
+    ImageDraw.Draw(titled).text(
+        ((image.width - (right - left)) // 2 - left, TITLE_PADDING - top),
+        title, font=font, fill="black")
+    return titled
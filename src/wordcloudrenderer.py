@@ -0,0 +1,244 @@
+import collections
+import hashlib
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import AbstractSet, Any, Callable, Dict, Hashable, Optional, \
+    Tuple
+
+from src.imageuploader import upload_bytes
+
+log = logging.getLogger(__name__)
+
+JOB_STARTED = "started"
+JOB_DUPLICATE = "duplicate"
+JOB_QUEUE_FULL = "queue full"
+JOB_CACHED = "cached"
+
+RESOURCES_PATH = Path(__file__).parent.absolute() / "resources"
+DEFAULT_MASK = RESOURCES_PATH / "tux.png"
+# Optional <nick>.png and <channel>.png masks
+MASKS_PATH = RESOURCES_PATH / "masks"
+
+# Called with the image link, or with the error if the job failed
+DoneCallback = Callable[[Optional[str], Optional[BaseException]], None]
+
+
+def find_mask(name: str, channel: str) -> Path:
+    """
+    Mask image of the user if there is one, else the one of the channel,
+    else tux.
+    """
+    for stem in (name.casefold(), channel.lstrip('#').casefold()):
+        path = MASKS_PATH / (stem + ".png")
+        # Channel names may contain slashes
+        if path.parent == MASKS_PATH and path.is_file():
+            return path
+    return DEFAULT_MASK
+
+
+def render_wordcloud(name: str, user_text: str, stopwords: AbstractSet[str],
+                     use_title: bool, mask_path: Path) -> str:
+    """
+    Render and upload the word cloud of a user, return the image link.
+    Runs in a worker process, which keeps its mask cache between jobs.
+    """
+    # Only the workers load numpy, Pillow and wordcloud
+    from src.wordclouddrawing import draw_wordcloud
+
+    buffer = io.BytesIO()
+    image = draw_wordcloud(name, user_text, stopwords, use_title, mask_path)
+    image.save(buffer, "PNG")
+    res = upload_bytes(buffer.getvalue())
+    return res['link']
+
+
+def warm_up_worker() -> None:
+    from src.wordclouddrawing import load_mask
+    load_mask(DEFAULT_MASK)
+
+
+class LinkCache:
+    """
+    Links of uploaded clouds, dropped after ttl seconds or when more than
+    size are kept, least recently used first.
+    """
+
+    def __init__(self, size: int, ttl: float,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self._size = size
+        self._ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Key -> (expiry time, link)
+        self._links: 'collections.OrderedDict[Hashable, Tuple[float, str]]' = \
+            collections.OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self._lock:
+            entry = self._links.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._links[key]
+                return None
+            self._links.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, link: str) -> None:
+        with self._lock:
+            self._links[key] = (self._clock() + self._ttl, link)
+            self._links.move_to_end(key)
+            while len(self._links) > self._size:
+                self._links.popitem(last=False)
+
+
+def fingerprint(user_text: str, stopwords: AbstractSet[str],
+                mask_path: Path) -> str:
+    """
+    Hash of everything a cloud is drawn from, apart from nick and title.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (user_text, *sorted(stopwords), str(mask_path)):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class WordCloudRenderer:
+    """
+    Renders word clouds on a bounded process pool, so the CPU heavy work
+    never holds the GIL of the bot process.
+
+    At most max_workers clouds render at once and at most max_jobs are
+    running or queued. Only one job per nick is accepted at a time. Jobs
+    that take longer than timeout seconds are reported as failed. A render
+    cannot be interrupted, so then the pool is killed, as after a worker
+    died, and replaced on the next job; other jobs on it fail as well.
+
+    Links of finished clouds are cached, asking for the same cloud again
+    before the messages of the user change is answered right away.
+    """
+
+    def __init__(self, max_workers: int, max_jobs: int, timeout: float,
+                 cache_size: int = 64, cache_ttl: float = 3600) -> None:
+        self._max_workers = max_workers
+        self._max_jobs = max_jobs
+        self._timeout = timeout
+        self._links = LinkCache(cache_size, cache_ttl)
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Casefolded nick -> future of its running or queued job
+        self._jobs: Dict[Tuple[str, str], Future] = {}
+
+    def submit(self, name: str, user_text: str, stopwords: AbstractSet[str],
+               use_title: bool, mask_path: Path,
+               on_done: DoneCallback, channel: str = '') -> str:
+        # One job per nick and channel at a time
+        key = (channel.casefold(), name.casefold())
+        cache_key = (key[1], use_title,
+                     fingerprint(user_text, stopwords, mask_path))
+        link = self._links.get(cache_key)
+        if link is not None:
+            on_done(link, None)
+            return JOB_CACHED
+
+        with self._lock:
+            if key in self._jobs:
+                return JOB_DUPLICATE
+            if len(self._jobs) >= self._max_jobs:
+                return JOB_QUEUE_FULL
+            executor, future = self._submit(
+                render_wordcloud, name, user_text, stopwords, use_title,
+                mask_path)
+            self._jobs[key] = future
+
+        timer = threading.Timer(
+            self._timeout, self._finish,
+            (key, cache_key, executor, future, on_done, True))
+        timer.daemon = True
+        timer.start()
+
+        def done(f: Future) -> None:
+            timer.cancel()
+            self._finish(key, cache_key, executor, f, on_done, False)
+
+        future.add_done_callback(done)
+        return JOB_STARTED
+
+    def warm_up(self) -> None:
+        """
+        Start a worker and have it load its libraries and the default mask
+        now instead of on the first cloud.
+        """
+        with self._lock:
+            self._submit(warm_up_worker)
+
+    def _submit(self, fn: Callable, *args: Any) \
+            -> Tuple[ProcessPoolExecutor, Future]:
+        # With the lock held
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died since the last job
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(fn, *args)
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        # With the lock held. Kill the workers, a hung one would keep its
+        # slot, the next job gets a new pool
+        if self._executor is not executor:
+            return
+        self._executor = None
+        kill_workers = getattr(executor, 'kill_workers', None)
+        if kill_workers is not None:
+            kill_workers()
+        else:
+            # Before Python 3.14 only the private map of workers has them
+            processes = getattr(executor, '_processes', None) or {}
+            for process in list(processes.values()):
+                process.kill()
+        executor.shutdown(wait=False)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawn, forking a process with running threads is unsafe
+            self._executor = ProcessPoolExecutor(
+                self._max_workers,
+                mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _finish(self, key: Tuple[str, str], cache_key: Hashable,
+                executor: ProcessPoolExecutor, future: Future,
+                on_done: DoneCallback, timed_out: bool) -> None:
+        # Whichever of completion and timeout comes first reports
+        with self._lock:
+            if self._jobs.get(key) is not future:
+                return
+            del self._jobs[key]
+            if timed_out or isinstance(future.exception(), BrokenProcessPool):
+                self._discard_executor(executor)
+        try:
+            if timed_out:
+                on_done(None, TimeoutError(
+                    f"Word cloud took longer than {self._timeout}s"))
+            elif future.exception() is not None:
+                on_done(None, future.exception())
+            else:
+                self._links.put(cache_key, future.result())
+                on_done(future.result(), None)
+        except Exception as e:
+            log.error(e)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -0,0 +1,128 @@
+import collections
+import heapq
+import re
+import threading
+from typing import Callable, Collection, Counter, Deque, Dict, Iterable, \
+    List, Optional, Set, Tuple
+
+# Default tokenization of sklearn's CountVectorizer
+TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
+def tokenize(message: str) -> List[str]:
+    return TOKEN_RE.findall(message.lower())
+
+
+class UserWords:
+    __slots__ = ('messages', 'counts')
+
+    def __init__(self, message_log_size: Optional[int]) -> None:
+        # Without a size messages never fall off and need not be kept
+        self.messages: Optional[Deque[str]] = None
+        if message_log_size is not None:
+            self.messages = collections.deque(maxlen=message_log_size)
+        self.counts: Counter[str] = collections.Counter()
+
+    def append(self, message: str) -> None:
+        if self.messages is None:
+            self.counts.update(tokenize(message))
+            return
+        # Uncount the message that is about to fall off
+        if len(self.messages) == self.messages.maxlen:
+            for token in tokenize(self.messages[0]):
+                self.counts[token] -= 1
+                if not self.counts[token]:
+                    del self.counts[token]
+        self.messages.append(message)
+        self.counts.update(tokenize(message))
+
+
+class WordFrequencyIndex:
+    """
+    Running word counts over the message log of a user, kept in step with
+    the log as messages are added and fall off.
+
+    Users are only tracked after their first lookup, when their log is
+    loaded once through load_messages; at most max_users are kept. The
+    log is loaded and counted without the lock, and only kept if no
+    message of the user was added meanwhile.
+
+    With archived set the counts span the whole archived history: nothing
+    falls off, a user is recounted after invalidate instead.
+    """
+
+    def __init__(self, message_log_size: int,
+                 load_messages: Callable[[str], Iterable[str]],
+                 max_users: int = 64, archived: bool = False) -> None:
+        self._message_log_size: Optional[int] = \
+            None if archived else message_log_size
+        self._load_messages = load_messages
+        self._max_users = max_users
+        # Marked without the lock, it may be held by a thread waiting
+        # for the one that expires messages
+        self._stale: Set[str] = set()
+        self._users: 'collections.OrderedDict[str, UserWords]' = \
+            collections.OrderedDict()
+        # Nick being loaded -> [loaders, messages added since]
+        self._loading: Dict[str, List[int]] = {}
+        # Also held by the bot while a message goes to the store and here,
+        # so a log loaded in between is never counted twice or missed
+        self.lock = threading.RLock()
+
+    def add_message(self, name: str, message: str) -> None:
+        with self.lock:
+            user_words = self._users.get(name)
+            if user_words is not None:
+                user_words.append(message)
+            loading = self._loading.get(name)
+            if loading is not None:
+                loading[1] += 1
+
+    def invalidate(self, name: str) -> None:
+        """
+        Recount a user on the next lookup, e.g. after messages expired.
+        """
+        self._stale.add(name)
+
+    def top_words(self, name: str, n: int,
+                  stopwords: Collection[str]) -> List[Tuple[str, int]]:
+        for _ in range(3):
+            with self.lock:
+                if name in self._stale:
+                    self._stale.discard(name)
+                    self._users.pop(name, None)
+                user_words = self._users.get(name)
+                if user_words is not None:
+                    self._users.move_to_end(name)
+                    counts = [(w, c) for w, c in user_words.counts.items()
+                              if w not in stopwords]
+                    return heapq.nlargest(n, counts, key=lambda x: x[1])
+                loading = self._loading.setdefault(name, [0, 0])
+                loading[0] += 1
+                added = loading[1]
+
+            # May be the whole archive, don't hold up new messages
+            try:
+                user_words = UserWords(self._message_log_size)
+                for message in self._load_messages(name):
+                    user_words.append(message)
+            finally:
+                with self.lock:
+                    loading[0] -= 1
+                    if not loading[0]:
+                        del self._loading[name]
+
+            with self.lock:
+                if (name in self._users or name in self._stale or
+                        loading[1] != added):
+                    continue
+                self._users[name] = user_words
+                if len(self._users) > self._max_users:
+                    self._users.popitem(last=False)
+                counts = [(w, c) for w, c in user_words.counts.items()
+                          if w not in stopwords]
+            return heapq.nlargest(n, counts, key=lambda x: x[1])
+        # The user keeps talking, answer without keeping the counts
+        counts = [(w, c) for w, c in user_words.counts.items()
+                  if w not in stopwords]
+        return heapq.nlargest(n, counts, key=lambda x: x[1])
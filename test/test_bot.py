@@ -1,11 +1,276 @@
+import asyncio
+import os
+import signal
+import tempfile
+import threading
 import unittest
+from typing import Callable, Dict, List
+from unittest import mock
+from unittest.mock import MagicMock
 
+from src.channel import move_legacy_storage
+from src.engines import Engines
 from src.ircbot import IRCBot
+from src.ircmsg import parse_line
+from src.settings import CONFIG, get_network_config
+from src.userstore.sqliteuserstore import SqliteUserStore
 
 
 class BotBaseTest(unittest.TestCase):
 
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bots: List[IRCBot] = []
+
+    def tearDown(self) -> None:
+        for bot in self.bots:
+            for channel in bot.channels.values():
+                channel.close()
+        self.tmp_dir.cleanup()
+
+    def create_bot(self, **settings: str) -> IRCBot:
+        bot = IRCBot(dict(CONFIG, **settings), storage_dir=self.tmp_dir.name)
+        self.bots.append(bot)
+        return bot
+
     def test_read_db_txt_files(self) -> None:
-        class_under_test = IRCBot()
+        class_under_test = self.create_bot()
         file_readings = class_under_test.read_db_txt_files()
         self.assertEqual(3, len(file_readings))
+
+    def test_reload_resources(self) -> None:
+        class_under_test = self.create_bot()
+        class_under_test.reload_resources()
+        resources = class_under_test.resources
+        self.assertIn('StormBot', resources.bot_bros)
+        self.assertTrue(resources.responses)
+
+        # Unchanged files keep their derived structures
+        class_under_test.reload_resources({
+            IRCBot.get_resources_dir_file('bots.txt')})
+        self.assertIs(resources.trigger_matcher,
+                      class_under_test.resources.trigger_matcher)
+        self.assertIs(resources.responses,
+                      class_under_test.resources.responses)
+
+    def test_move_legacy_storage(self) -> None:
+        with tempfile.TemporaryDirectory() as storage_dir:
+            for filename in ['users.sqlite3', 'other.txt']:
+                open(os.path.join(storage_dir, filename), 'w').close()
+            channel_dir = os.path.join(storage_dir, 'channels', '#test')
+            move_legacy_storage(storage_dir, channel_dir)
+            self.assertEqual(['users.sqlite3'], os.listdir(channel_dir))
+
+            self.assertEqual(['channels', 'other.txt'],
+                             sorted(os.listdir(storage_dir)))
+
+            # Only once
+            open(os.path.join(storage_dir, 'users.json'), 'w').close()
+            move_legacy_storage(storage_dir, channel_dir)
+            self.assertEqual(['users.sqlite3'], os.listdir(channel_dir))
+
+    def test_join_once_per_login(self) -> None:
+        bot = self.create_bot(channel='#test,#other', bot_nick='bot')
+        bot._sender.send_join = MagicMock()
+        # Services NOTICE and RPL_LOGGEDIN for the same login
+        bot.on_login_notice(parse_line(
+            ":NickServ!a@b NOTICE bot :You are now logged in as bot."))
+        bot.on_login_notice(parse_line(
+            ":server 900 bot bot!b@c bot :You are now logged in as bot"))
+        self.assertEqual([mock.call('#test'), mock.call('#other')],
+                         bot._sender.send_join.call_args_list)
+
+    def test_channels(self) -> None:
+        bot = self.create_bot(channel='#First,#test')
+        first = bot.get_channel('#first')
+        second = bot.get_channel('#TEST')
+        self.assertEqual(['#first', '#test'], sorted(os.listdir(
+            os.path.join(self.tmp_dir.name, 'channels'))))
+        self.assertIsNone(bot.get_channel('#third'))
+
+        first.add_message('SomeNick', 'hello')
+        self.assertEqual('hello', first.find_user('some')['lastmessage'])
+        self.assertIsNone(second.find_user('some'))
+        # Commands of a channel answer there
+        self.assertIs(second, second.commands['time']._receiver)
+        self.assertIsNot(first.commands['time'], second.commands['time'])
+
+    def test_tinydb_without_archive(self) -> None:
+        with mock.patch.dict(CONFIG, {'user_db_backend': 'tinydb',
+                                      'user_db_message_log_size': '3',
+                                      'user_db_archive_size': '10'}):
+            bot = self.create_bot(channel='#test')
+        channel = bot.get_channel('#test')
+        # Counted from the start, so messages falling off are uncounted
+        self.assertEqual([], channel.word_index.top_words('nick', 10, ()))
+        for word in ['apple', 'banana', 'cherry', 'durian', 'elder', 'fig']:
+            channel.add_message('nick', word)
+        self.assertEqual(['durian', 'elder', 'fig'],
+                         channel.user_db.get('nick')['messages'])
+        self.assertEqual(['durian', 'elder', 'fig'], sorted(
+            w for w, _ in channel.word_index.top_words('nick', 10, ())))
+
+    def test_networks(self) -> None:
+        engines = Engines()
+        first_bot = IRCBot(dict(CONFIG, channel='#test'), engines,
+                           os.path.join(self.tmp_dir.name, 'first'))
+        second_bot = IRCBot(dict(CONFIG, channel='#test'), engines,
+                            os.path.join(self.tmp_dir.name, 'second'))
+        self.bots.append(second_bot)
+        first = first_bot.get_channel('#test')
+        second = second_bot.get_channel('#test')
+        self.assertIs(first.wordcloud_renderer, second.wordcloud_renderer)
+        self.assertIs(first_bot.commands, second_bot.commands)
+        # Own connection and channel state per network
+        self.assertIsNot(first_bot._sender, second_bot._sender)
+        first.add_message('SomeNick', 'hello')
+        self.assertIsNone(second.find_user('some'))
+
+        # Shutting down one network leaves the shared engines running
+        asyncio.run(first_bot.shutdown())
+        store = SqliteUserStore(os.path.join(
+            self.tmp_dir.name, 'first', 'channels', '#test', 'users.sqlite3'), 3)
+        self.assertEqual('hello', store.get('SomeNick')['lastmessage'])
+        store.close()
+        self.assertEqual(1, engines.command_executor.submit(int, 1).result())
+        engines.shutdown()
+
+    def test_network_config(self) -> None:
+        with mock.patch.dict(os.environ, {'LIBERA_CHAT_SERVER': 'irc.libera.chat',
+                                          'LIBERA_CHAT_PORT': '6697',
+                                          'LIBERA_CHAT_STOPWORDS': 'no'}):
+            config = get_network_config('libera-chat')
+        self.assertEqual('irc.libera.chat', config['server'])
+        self.assertEqual('6697', config['port'])
+        # Only network settings are overridden
+        self.assertEqual(CONFIG['stopwords'], config['stopwords'])
+        self.assertEqual(CONFIG['channel'], config['channel'])
+
+
+class FakeServer:
+    """
+    Accepts the connections of a bot and records the lines it sends.
+    """
+
+    def __init__(self) -> None:
+        self.writers: List[asyncio.StreamWriter] = []
+        self.lines: List[str] = []
+        self._server = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(
+            self._accept, '127.0.0.1', 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    def close(self) -> None:
+        self._server.close()
+
+    def send(self, line: str) -> None:
+        self.writers[-1].write(line.encode() + b'\r\n')
+
+    async def wait_for(self, condition: Callable[[], bool]) -> None:
+        for _ in range(500):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"Timed out, received {self.lines}")
+
+    async def _accept(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        self.writers.append(writer)
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            self.lines.append(line.decode().strip())
+
+
+class BotLoopTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def create_bot(self, port: int, **settings: str) -> IRCBot:
+        config = dict(CONFIG, server='127.0.0.1', port=str(port),
+                      channel='#test', bot_nick='bot', password='pw',
+                      send_interval='0.01', send_burst='20')
+        config.update(settings)
+        return IRCBot(config, storage_dir=self.tmp_dir.name)
+
+    def test_pong_while_busy(self) -> None:
+        async def run() -> List[str]:
+            server = FakeServer()
+            # Only PASS goes out at once, the rest of the login waits
+            bot = self.create_bot(await server.start(), send_interval='10',
+                                  send_burst='1')
+            bot._quit_timeout = 0.1
+            task = asyncio.ensure_future(bot.run_async(handle_signals=False))
+            await server.wait_for(lambda: bool(server.lines))
+
+            # Chat handling is stuck, the loop still answers
+            blocker = threading.Event()
+            bot.engines.dispatch_executor.submit(blocker.wait)
+            server.send(':a!b@c PRIVMSG #test :hi')
+            server.send('PING :abc')
+            await server.wait_for(lambda: 'PONG :abc' in server.lines)
+            lines = list(server.lines)
+
+            blocker.set()
+            bot.handle_sigterm()
+            await task
+            server.close()
+            return lines
+
+        self.assertEqual(['PASS pw', 'PONG :abc'], asyncio.run(run()))
+
+    def test_reconnect_after_eof(self) -> None:
+        async def run() -> List[str]:
+            server = FakeServer()
+            bot = self.create_bot(await server.start())
+            task = asyncio.ensure_future(bot.run_async(handle_signals=False))
+            await server.wait_for(lambda: 'NICK bot' in server.lines)
+            server.writers[0].close()
+
+            await server.wait_for(lambda: len(server.writers) == 2 and
+                                  server.lines.count('NICK bot') == 2)
+            bot.handle_sigterm()
+            await task
+            server.close()
+            return server.lines
+
+        self.assertEqual(['PASS pw', 'USER bot bot bot:snoobotasmo .',
+                          'NICK bot'] * 2 + ['QUIT'], asyncio.run(run()))
+
+    def test_sigterm_quits_and_flushes(self) -> None:
+        threads: Dict[str, int] = {}
+
+        async def run() -> List[str]:
+            server = FakeServer()
+            bot = self.create_bot(await server.start())
+            close_channels = bot._close_channels
+
+            def record_thread() -> None:
+                threads['close'] = threading.get_ident()
+                close_channels()
+
+            bot._close_channels = record_thread  # type: ignore
+            task = asyncio.ensure_future(bot.run_async())
+            await server.wait_for(lambda: 'NICK bot' in server.lines)
+            bot.get_channel('#test').add_message('SomeNick', 'hello')
+
+            os.kill(os.getpid(), signal.SIGTERM)
+            await task
+            await server.wait_for(lambda: 'QUIT' in server.lines)
+            server.close()
+            return server.lines
+
+        self.assertEqual('QUIT', asyncio.run(run())[-1])
+        # Closed off the event loop, and written
+        self.assertNotEqual(threading.get_ident(), threads['close'])
+        store = SqliteUserStore(os.path.join(
+            self.tmp_dir.name, 'channels', '#test', 'users.sqlite3'), 3)
+        self.assertEqual('hello', store.get('SomeNick')['lastmessage'])
+        store.close()
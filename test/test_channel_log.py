@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+
+from src.channellog import ENTRY, ChannelLog, LogEntry
+
+
+class ChannelLogTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp_dir.name, 'log')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_range_over_segments(self) -> None:
+        log = ChannelLog(self.directory, segment_seconds=10, max_segments=10)
+        for t in range(30):
+            log.append(f'nick{t % 3}', f'msg {t}', float(t))
+        self.assertEqual(3, len(os.listdir(self.directory)) // 2)
+
+        entries = list(log.entries(8.0, 21.5))
+        self.assertEqual(list(range(8, 22)), [e.timestamp for e in entries])
+        self.assertEqual(LogEntry(8.0, 'nick2', 'msg 8'), entries[0])
+        self.assertEqual(30, len(list(log.entries(0.0))))
+        self.assertEqual([], list(log.entries(30.0)))
+        log.close()
+
+    def test_retention(self) -> None:
+        log = ChannelLog(self.directory, segment_seconds=10, max_segments=2)
+        for t in range(0, 40, 5):
+            log.append('nick', 'msg', float(t))
+        self.assertEqual([20.0, 25.0, 30.0, 35.0],
+                         [e.timestamp for e in log.entries(0.0)])
+        log.close()
+
+    def test_reopen(self) -> None:
+        log = ChannelLog(self.directory, segment_seconds=10, max_segments=2)
+        log.append('nick', 'with\ttab', 1.0)
+        log.close()
+        # A torn index entry is dropped on reopen
+        with open(os.path.join(self.directory, '000000000000.idx'),
+                  'ab') as f:
+            f.write(b'\0' * (ENTRY.size // 2))
+
+        log = ChannelLog(self.directory, segment_seconds=10, max_segments=2)
+        log.append('nick', 'ünïcode', 2.0)
+        self.assertEqual([LogEntry(1.0, 'nick', 'with\ttab'),
+                          LogEntry(2.0, 'nick', 'ünïcode')],
+                         list(log.entries(0.0)))
+        log.close()
+
+    def test_clock_going_back(self) -> None:
+        log = ChannelLog(self.directory, segment_seconds=10, max_segments=2,
+                         clock=iter([5.0, 3.0]).__next__)
+        log.append('nick', 'a')
+        log.append('nick', 'b')
+        self.assertEqual([5.0, 5.0], [e.timestamp for e in log.entries(4.0)])
+        log.close()
+
+    def test_clock_behind_after_reopen(self) -> None:
+        log = ChannelLog(self.directory, segment_seconds=10, max_segments=2)
+        log.append('nick', 'a', 15.0)
+        log.close()
+
+        log = ChannelLog(self.directory, segment_seconds=10, max_segments=2,
+                         clock=lambda: 12.0)
+        log.append('nick', 'b')
+        self.assertEqual([LogEntry(15.0, 'nick', 'a'),
+                          LogEntry(15.0, 'nick', 'b')],
+                         list(log.entries(14.0)))
+        log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,13 @@
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
 from unittest.mock import MagicMock
 
-from src.command import HelpCommand, CopypastaCommand
+from src.command import ActivityCommand, ChannelWordsCommand, HelpCommand, \
+    CopypastaCommand, SentimentCommand
+from src.channel import Channel
 from src.ircbot import IRCBot
 from src.sender.sender import Sender
 
@@ -9,55 +15,131 @@ from src.sender.sender import Sender
 class CommandBaseTest(unittest.TestCase):
     nick = "test_nick"
 
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # Bots keep their storage in tmp_dir
+        self.storage_patch = mock.patch.object(
+            IRCBot, 'get_storage_dir_file',
+            staticmethod(lambda f: os.path.join(self.tmp_dir.name, f)))
+        self.storage_patch.start()
+        self.channels = []
+
+    def tearDown(self) -> None:
+        for channel in self.channels:
+            channel.close()
+        self.storage_patch.stop()
+        self.tmp_dir.cleanup()
+
+    def add_channel(self, bot: IRCBot, name: str = '#test') -> Channel:
+        channel = bot.add_channel(name)
+        self.channels.append(channel)
+        return channel
+
     def test_help_command(self) -> None:
         mock_bot = IRCBot()
+        channel = self.add_channel(mock_bot)
         mock_sender = Sender(
-            irc_socket=mock_bot._irc_sock,
+            writer=None,
             repeated_message_sleep_time=mock_bot.repeated_message_sleep_time)
         mock_sender.send_privmsg = MagicMock()
 
-        class_under_test = HelpCommand(mock_bot, mock_sender)
+        class_under_test = HelpCommand(channel, mock_sender)
         class_under_test.execute([self.nick, 'help'])
 
         mock_sender.send_privmsg.assert_called_with(
             f'Use {mock_bot.command_prefix}cmds for all commands, and '
             f'{mock_bot.command_prefix}about for more info.',
             self.nick,
-            mock_bot.max_message_length,
+            channel.max_message_length,
             notice=True)
 
     def test_copypasta_command_truncate(self) -> None:
         mock_bot = IRCBot()
-        mock_bot._max_message_length = 100
-        mock_bot._channel = '#test'
+        channel = self.add_channel(mock_bot)
+        channel.max_message_length = 100
         mock_sender = Sender(
-            irc_socket=mock_bot._irc_sock,
+            writer=None,
             repeated_message_sleep_time=mock_bot.repeated_message_sleep_time)
         mock_sender.send_privmsg = MagicMock()
 
-        class_under_test = CopypastaCommand(mock_bot, mock_sender)
+        class_under_test = CopypastaCommand(channel, mock_sender)
         class_under_test.execute(
             [self.nick, "copypasta I'd just like to interject for a moment"])
 
         expected_output = "I'd just like to interject for a moment. What you’re referring to as Copilot, is in fact, GPL/Copil…"
         self.assertLessEqual(len(expected_output), 100)
         mock_sender.send_privmsg.assert_any_call(expected_output, '#test',
-                                                 mock_bot.max_message_length)
+                                                 channel.max_message_length)
 
     def test_copypasta_command_short(self) -> None:
         mock_bot = IRCBot()
-        mock_bot._max_message_length = 100
-        mock_bot._channel = '#test'
+        channel = self.add_channel(mock_bot)
+        channel.max_message_length = 100
         mock_sender = Sender(
-            irc_socket=mock_bot._irc_sock,
+            writer=None,
             repeated_message_sleep_time=mock_bot.repeated_message_sleep_time)
         mock_sender.send_privmsg = MagicMock()
 
-        class_under_test = CopypastaCommand(mock_bot, mock_sender)
+        class_under_test = CopypastaCommand(channel, mock_sender)
         class_under_test.execute(
             [self.nick, 'copypasta The shortest copypasta ever'])
 
         expected_output = 'ass'
         self.assertLessEqual(len(expected_output), 100)
         mock_sender.send_privmsg.assert_any_call(expected_output, '#test',
-                                                 mock_bot.max_message_length)
+                                                 channel.max_message_length)
+
+    def test_channel_log_commands(self) -> None:
+        mock_bot = IRCBot()
+        channel = self.add_channel(mock_bot)
+        mock_sender = Sender(
+            writer=None,
+            repeated_message_sleep_time=mock_bot.repeated_message_sleep_time)
+        mock_sender.send_privmsg = MagicMock()
+
+        now = time.time()
+        channel.channel_log.append('a', 'old message', now - 5400)
+        channel.channel_log.append('b', 'arch arch gentoo', now - 10)
+        channel.channel_log.append('c', 'arch', now - 5)
+
+        ChannelWordsCommand(channel, mock_sender).execute(
+            [self.nick, 'chanwords'])
+        msg = mock_sender.send_privmsg.call_args[0][0]
+        self.assertIn('of last 1 hours', msg)
+        self.assertIn('a\u200brch\x02: 3', msg)
+        self.assertNotIn('old', msg)
+
+        ActivityCommand(channel, mock_sender).execute(
+            [self.nick, 'activity 3'])
+        msg = mock_sender.send_privmsg.call_args[0][0]
+        self.assertIn(': \u2581\u2584\u2588 (3 total, at most 2 an hour)',
+                      msg)
+
+        self.assertFalse(ActivityCommand(channel, mock_sender).execute(
+            [self.nick, 'activity 1000']))
+
+    def test_sentiment_of_last_messages(self) -> None:
+        mock_bot = IRCBot()
+        channel = self.add_channel(mock_bot)
+        mock_sender = Sender(
+            writer=None,
+            repeated_message_sleep_time=mock_bot.repeated_message_sleep_time)
+        mock_sender.send_privmsg = MagicMock()
+        for message in ['I hate this', 'I love this', 'great bot']:
+            channel.add_message('Hilda', message)
+
+        SentimentCommand(channel, mock_sender).execute(
+            [self.nick, 'sentiment hilda 2'])
+        self.assertIn('last 2 messages',
+                      mock_sender.send_privmsg.call_args[0][0])
+
+        # No batch of no messages, which would be all of them
+        self.assertFalse(SentimentCommand(channel, mock_sender).execute(
+            [self.nick, 'sentiment hilda 0']))
+        self.assertIn('from 1 on', mock_sender.send_privmsg.call_args[0][0])
+
+        # A nick prefix is text
+        SentimentCommand(channel, mock_sender).execute(
+            [self.nick, 'sentiment hi 2'])
+        self.assertIn('The text: "hi 2"',
+                      mock_sender.send_privmsg.call_args[0][0])
@@ -0,0 +1,101 @@
+import unittest
+from typing import List
+from unittest import mock
+
+from src import commandregistry
+from src.command import COMMANDS, Command, ShrugCommand, UpdogCommand, \
+    UptimeCommand
+from src.commandregistry import CommandRegistry, CommandTrie
+
+
+class CommandTrieTest(unittest.TestCase):
+    def test_unique_prefix_match(self) -> None:
+        trie: CommandTrie[int] = CommandTrie()
+        for value, key in enumerate(['updog', 'uptime', 'words', 'wordcloud']):
+            trie.insert(key, value)
+        self.assertEqual(3, trie.get('wordcloud'))
+        self.assertIsNone(trie.get('word'))
+        self.assertEqual(0, trie.unique_prefix_match('upd'))
+        self.assertEqual(1, trie.unique_prefix_match('upt'))
+        self.assertEqual(3, trie.unique_prefix_match('wordc'))
+        # words and wordcloud
+        self.assertIsNone(trie.unique_prefix_match('word'))
+        self.assertIsNone(trie.unique_prefix_match('x'))
+
+        trie.remove('wordcloud')
+        self.assertEqual(2, trie.unique_prefix_match('wo'))
+        self.assertIsNone(trie.get('wordcloud'))
+        trie.remove('words')
+        self.assertIsNone(trie.unique_prefix_match('w'))
+        self.assertEqual(0, trie.get('updog'))
+
+
+class CommandRegistryTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.created: List[type] = []
+
+        def factory(cls: type) -> Command:
+            self.created.append(cls)
+            return cls(None, None)
+
+        self.registry = CommandRegistry(factory)
+
+    def test_lazy_creation(self) -> None:
+        self.registry.load_module('src.command')
+        self.assertEqual(list(COMMANDS), list(self.registry))
+        self.assertIn('shrug', self.registry)
+        self.assertEqual([], self.created)
+
+        shrug = self.registry['shrug']
+        self.assertIsInstance(shrug, ShrugCommand)
+        self.assertIs(shrug, self.registry['shrug'])
+        self.assertEqual([ShrugCommand], self.created)
+
+    def test_resolve(self) -> None:
+        self.registry.register_class('updog', UpdogCommand, aliases=['ud'])
+        self.registry.register_class('uptime', UptimeCommand)
+        self.assertEqual('updog', self.registry.resolve('updog'))
+        self.assertEqual('updog', self.registry.resolve('ud'))
+        self.assertEqual('uptime', self.registry.resolve('upt'))
+        # Ambiguous, or too short to be taken as a prefix
+        self.assertIsNone(self.registry.resolve('up'))
+        self.registry.unregister('uptime')
+        self.assertIsNone(self.registry.resolve('u'))
+        self.assertEqual('updog', self.registry.resolve('upd'))
+
+    def test_unregister(self) -> None:
+        self.registry.register_class('updog', UpdogCommand, aliases=['ud'])
+        self.registry.unregister('updog')
+        self.assertNotIn('updog', self.registry)
+        self.assertIsNone(self.registry.resolve('ud'))
+        with self.assertRaises(KeyError):
+            self.registry.alias('dog', 'updog')
+
+    def test_bind(self) -> None:
+        self.registry.register_class('updog', UpdogCommand, aliases=['ud'])
+        receivers: List[str] = []
+
+        def factory(cls: type) -> Command:
+            receivers.append('#other')
+            return cls('#other', None)
+
+        bound = self.registry.bind(factory)
+        self.assertEqual('updog', bound.resolve('ud'))
+        self.assertIsNot(self.registry['updog'], bound['updog'])
+        self.assertEqual(['#other'], receivers)
+        self.assertEqual('#other', bound['updog']._receiver)
+
+    def test_entry_points(self) -> None:
+        ep = mock.Mock()
+        ep.name = 'dog'
+        ep.load.return_value = UpdogCommand
+        with mock.patch.object(commandregistry, 'get_entry_points',
+                               return_value=[ep]) as get_entry_points:
+            self.registry.load_entry_points()
+        get_entry_points.assert_called_once_with('ircbot.commands')
+        ep.load.assert_not_called()
+        self.assertIsInstance(self.registry['dog'], UpdogCommand)
+
+
+if __name__ == '__main__':
+    unittest.main()
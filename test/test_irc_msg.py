@@ -1,13 +1,12 @@
 import unittest
 
-from src.ircmsg import IrcMsg
+from src.ircmsg import IrcMsg, Message, parse_line
 
 
 class IrcMsgTest(unittest.TestCase):
     def test_irc_message_parsing(self) -> None:
         raw = ":SomeNick!SomeNick@snoonet.org/user/SomeNick PRIVMSG #linuxmasterrace :hello world"
-        result = IrcMsg.from_raw(raw)
-        print("RES", result)
+        result = IrcMsg.from_message(parse_line(raw))
         expected = IrcMsg(name="SomeNick",
                           channel="#linuxmasterrace",
                           msg="hello world")
@@ -15,8 +14,7 @@ class IrcMsgTest(unittest.TestCase):
 
     def test_irc_message_parsing_pm(self) -> None:
         raw = ":SomeNick!SomeNick@snoonet.org/user/SomeNick PRIVMSG muh_bot :hello world"
-        result = IrcMsg.from_raw(raw)
-        print("RES", result)
+        result = IrcMsg.from_message(parse_line(raw))
         expected = IrcMsg(name="SomeNick",
                           channel="muh_bot",
                           msg="hello world")
@@ -24,4 +22,39 @@ class IrcMsgTest(unittest.TestCase):
 
     def test_irc_message_parsing_fail(self) -> None:
         raw = ":SomeNick!SomeNick@snoonet.org/user/SomeNick muh_bot :hello world"
-        self.assertRaises(IndexError, IrcMsg.from_raw, raw=raw)
+        self.assertNotEqual('PRIVMSG', parse_line(raw).command)
+
+
+class ParseLineTest(unittest.TestCase):
+    def test_privmsg(self) -> None:
+        raw = ":SomeNick!some@snoonet.org/user/SomeNick PRIVMSG #linuxmasterrace :JOIN PING :x"
+        expected = Message({}, "SomeNick!some@snoonet.org/user/SomeNick",
+                           "PRIVMSG", ["#linuxmasterrace", "JOIN PING :x"])
+        self.assertEqual(expected, parse_line(raw))
+        self.assertEqual(("SomeNick", "some", "snoonet.org/user/SomeNick"),
+                         (expected.nick, expected.user, expected.host))
+        self.assertEqual(IrcMsg("SomeNick", "#linuxmasterrace", "JOIN PING :x"),
+                         IrcMsg.from_message(expected))
+
+    def test_tags_and_params(self) -> None:
+        raw = r"@time=2021-01-01T00:00:00Z;msgid=a\\sb\:c;flag :irc.snoonet.org 001  bot  :Welcome  "
+        message = parse_line(raw)
+        self.assertEqual({'time': "2021-01-01T00:00:00Z", 'msgid': r"a\sb;c", 'flag': ""},
+                         message.tags)
+        self.assertEqual("irc.snoonet.org", message.nick)
+        self.assertEqual("", message.host)
+        self.assertEqual("001", message.command)
+        self.assertEqual(["bot", "Welcome  "], message.params)
+
+    def test_no_prefix(self) -> None:
+        message = parse_line("ping :irc.snoonet.org")
+        self.assertEqual("PING", message.command)
+        self.assertEqual("irc.snoonet.org", message.trailing)
+        self.assertEqual("", message.prefix)
+        self.assertEqual([], parse_line("QUIT").params)
+
+    def test_invalid(self) -> None:
+        self.assertIsNone(parse_line(""))
+        self.assertIsNone(parse_line(":prefix-only"))
+        self.assertIsNone(parse_line("@tags-only"))
+        self.assertIsNone(IrcMsg.from_message(parse_line(":a!b@c PRIVMSG #chan")))
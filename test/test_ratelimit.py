@@ -0,0 +1,45 @@
+import unittest
+
+from src.ratelimit import CommandLimiter
+
+
+class CommandLimiterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = [0.0]
+        self.limiter = CommandLimiter(
+            user_rate=1.0, user_burst=3, command_rate=1.0, command_burst=10,
+            max_delay=5, clock=lambda: self.now[0])
+
+    def test_per_user(self) -> None:
+        for _ in range(3):
+            self.assertEqual(0.0, self.limiter.acquire('spammer', 'shrug'))
+        # Over budget, deferred once, then dropped
+        self.assertEqual(1.0, self.limiter.acquire('Spammer', 'shrug'))
+        self.assertIsNone(self.limiter.acquire('spammer', 'shrug'))
+        # Others are not locked out
+        self.assertEqual(0.0, self.limiter.acquire('other', 'time'))
+
+        self.limiter.release_deferred('spammer')
+        self.now[0] = 2.0
+        self.assertEqual(0.0, self.limiter.acquire('spammer', 'shrug'))
+
+    def test_command_cost(self) -> None:
+        self.assertEqual(0.0, self.limiter.acquire('a', 'wordcloud', 10))
+        # The command bucket is empty, the cost is capped for the user
+        self.assertIsNone(self.limiter.acquire('b', 'wordcloud', 10))
+        self.assertEqual(0.0, self.limiter.acquire('b', 'shrug'))
+        self.now[0] = 10.0
+        self.assertEqual(0.0, self.limiter.acquire('b', 'wordcloud', 10))
+
+    def test_deferred_reserves_tokens(self) -> None:
+        for _ in range(3):
+            self.limiter.acquire('nick', 'shrug')
+        self.assertEqual(1.0, self.limiter.acquire('nick', 'shrug'))
+        self.limiter.release_deferred('nick')
+        # The next token is already taken by the deferred command
+        self.now[0] = 1.0
+        self.assertEqual(1.0, self.limiter.acquire('nick', 'shrug'))
+
+
+if __name__ == '__main__':
+    unittest.main()
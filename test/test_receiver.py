@@ -0,0 +1,31 @@
+import asyncio
+import unittest
+
+from src.receiver.receiver import Receiver
+
+
+class ReceiverTest(unittest.TestCase):
+
+    def test_frame_across_chunks(self) -> None:
+        receiver = Receiver(None, socket_timeout=1)
+        raw = ":SomeNick!s@h PRIVMSG #test :¯\\_(ツ)_/¯\r\nPING :abc\r\n".encode()
+        # Cut inside the multibyte character
+        cut = raw.index("ツ".encode()) + 1
+
+        self.assertEqual([], receiver.frame(raw[:cut]))
+        self.assertEqual([":SomeNick!s@h PRIVMSG #test :¯\\_(ツ)_/¯",
+                          "PING :abc"], receiver.frame(raw[cut:]))
+
+    def test_frame_invalid_utf8(self) -> None:
+        receiver = Receiver(None, socket_timeout=1)
+        self.assertEqual(["a�b", "c"], receiver.frame(b"a\xffb\r\nc\n"))
+
+    def test_receive_msg_eof(self) -> None:
+        async def receive() -> list:
+            reader = asyncio.StreamReader()
+            receiver = Receiver(reader, socket_timeout=1)
+            reader.feed_data(b"PING :abc\r\nPI")
+            reader.feed_eof()
+            return [await receiver.receive_msg(), await receiver.receive_msg()]
+
+        self.assertEqual([["PING :abc"], [""]], asyncio.run(receive()))
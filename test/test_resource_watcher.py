@@ -0,0 +1,32 @@
+import os
+import tempfile
+import threading
+import unittest
+from typing import Set
+
+from src.resourcewatcher import ResourceWatcher
+
+
+class ResourceWatcherTest(unittest.TestCase):
+
+    def test_reports_changed_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, n) for n in ('a.txt', 'b.txt')]
+            for path in paths:
+                with open(path, 'w') as f:
+                    f.write('old')
+
+            changed: Set[str] = set()
+            event = threading.Event()
+
+            def on_change(paths: Set[str]) -> None:
+                changed.update(paths)
+                event.set()
+
+            watcher = ResourceWatcher(paths, on_change, poll_interval=0.05)
+            watcher.start()
+            with open(paths[1], 'w') as f:
+                f.write('new content')
+            self.assertTrue(event.wait(5))
+            watcher.stop()
+            self.assertEqual({paths[1]}, changed)
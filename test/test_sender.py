@@ -0,0 +1,71 @@
+import asyncio
+import unittest
+from typing import List
+
+from src.ratelimit import TokenBucket
+from src.sender.sender import Sender
+from src.sender.splitter import byte_length, split_message
+
+
+class FakeWriter:
+    def __init__(self) -> None:
+        self.lines: List[bytes] = []
+
+    def write(self, data: bytes) -> None:
+        self.lines.append(data)
+
+    async def drain(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class SenderTest(unittest.TestCase):
+
+    def test_pong_jumps_queue(self) -> None:
+        async def send() -> List[bytes]:
+            writer = FakeWriter()
+            sender = Sender(None, repeated_message_sleep_time=0.05, burst=1)
+            sender.writer = writer  # type: ignore
+            sender.send_privmsg("one", "#test", 100)
+            sender.send_privmsg("two", "#test", 100)
+            await asyncio.sleep(0.01)
+            future = sender.enqueue("PONG :abc\r\n", priority=0,
+                                    with_future=True)
+            await asyncio.wrap_future(future)  # type: ignore
+            await asyncio.sleep(0.1)
+            sender.close()
+            return writer.lines
+
+        self.assertEqual([b"PRIVMSG #test :one\n", b"PONG :abc\r\n",
+                          b"PRIVMSG #test :two\n"], asyncio.run(send()))
+
+    def test_token_bucket(self) -> None:
+        now = [0.0]
+        bucket = TokenBucket(rate=2.0, capacity=2, clock=lambda: now[0])
+        self.assertEqual(0.0, bucket.consume())
+        self.assertEqual(0.0, bucket.consume())
+        self.assertAlmostEqual(0.5, bucket.consume())
+        now[0] = 0.5
+        self.assertEqual(0.0, bucket.consume())
+
+
+class SplitterTest(unittest.TestCase):
+
+    def test_split_on_words(self) -> None:
+        self.assertEqual(["aaa bbb", "ccc"], split_message("aaa bbb ccc", 7))
+        self.assertEqual(["short"], split_message("short", 0))
+        self.assertEqual([], split_message("", 10))
+
+    def test_split_by_bytes(self) -> None:
+        shrug = r"¯\_(ツ)_/¯"
+        parts = split_message(shrug * 3, 20)
+        self.assertEqual(shrug * 3, ''.join(parts))
+        for part in parts:
+            self.assertLessEqual(byte_length(part), 20)
+
+    def test_never_split_formatting_codes(self) -> None:
+        msg = "\x0312,04" + "x" * 10
+        parts = split_message(msg, 8)
+        self.assertEqual(["\x0312,04xx", "xxxxxxxx"], parts)
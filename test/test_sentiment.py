@@ -0,0 +1,25 @@
+import unittest
+
+from textblob import TextBlob
+
+from src.sentiment import SentimentService
+
+
+class SentimentServiceTest(unittest.TestCase):
+
+    def test_analyze_matches_textblob(self) -> None:
+        service = SentimentService()
+        text = "I love this great bot"
+        result = service.analyze(text)
+        blob = TextBlob(text)
+        self.assertEqual(blob.sentiment.polarity, result.polarity)
+        self.assertEqual(blob.sentiment.subjectivity, result.subjectivity)
+        self.assertIn('compound', result.vader)
+
+    def test_analyze_batch_uses_cache(self) -> None:
+        service = SentimentService(cache_size=2)
+        texts = ["good", "bad", "good"]
+        results = service.analyze_batch(texts)
+        self.assertEqual(3, len(results))
+        self.assertIs(results[0], results[2])
+        self.assertIs(results[1], service.analyze("bad"))
@@ -0,0 +1,22 @@
+import json
+import unittest
+
+from src.ircbot import IRCBot
+from src.triggermatcher import TriggerMatcher
+
+
+class TriggerMatcherTest(unittest.TestCase):
+
+    def test_find_all_in_table_order(self) -> None:
+        matcher = TriggerMatcher({'she': [], 'he': [], 'hers': [], 'x': []})
+        self.assertEqual(['she', 'he', 'hers'], matcher.find_all('ushers'))
+        self.assertEqual([], matcher.find_all('nothing'))
+
+    def test_same_as_find(self) -> None:
+        with open(IRCBot.get_resources_dir_file('triggers.json')) as f:
+            triggers = json.load(f)
+        matcher = TriggerMatcher(triggers)
+        for text in ['i use arch btw', 'distro hopping on windows',
+                     '.np some song', 'gnu linux microsoft', '']:
+            expected = [k for k in triggers if text.find(k) != -1]
+            self.assertEqual(expected, matcher.find_all(text))
@@ -0,0 +1,284 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from typing import Any, Dict, Optional
+from unittest import mock
+
+from tinydb import TinyDB
+
+from src.userstore.messagearchive import MessageArchive
+from src.userstore.migration import migrate_tinydb_users
+from src.userstore.residentuserstore import MessageLog, ResidentUserStore
+from src.userstore.sqliteuserstore import SqliteUserStore
+from src.userstore.userindex import UserIndex
+from src.userstore.writebehinduserstore import WriteBehindUserStore
+
+
+class SqliteUserStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'users.sqlite3')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_add_message(self) -> None:
+        store = SqliteUserStore(self.db_path, message_log_size=3)
+        for i in range(5):
+            store.add_message('SomeNick', f'msg {i}', float(i))
+
+        user = store.get('SomeNick')
+        self.assertEqual({'name': 'SomeNick',
+                          'lastseen': 4.0,
+                          'lastmessage': 'msg 4',
+                          'messages': ['msg 2', 'msg 3', 'msg 4']}, user)
+        self.assertIsNone(store.get('OtherNick'))
+        store.close()
+
+    def test_persistence(self) -> None:
+        store = SqliteUserStore(self.db_path, message_log_size=3)
+        store.add_message('SomeNick', 'hello', 1.0)
+        store.add_message('OtherNick', 'world', 2.0)
+        store.close()
+
+        store = SqliteUserStore(self.db_path, message_log_size=3)
+        self.assertEqual(['SomeNick', 'OtherNick'], store.names())
+        self.assertEqual('world', store.get('OtherNick')['lastmessage'])
+        store.close()
+
+    def test_migrate_tinydb_users(self) -> None:
+        json_path = os.path.join(self.tmp_dir.name, 'users.json')
+        legacy_db = TinyDB(json_path)
+        legacy_db.insert({'name': 'SomeNick',
+                          'lastseen': 1.0,
+                          'lastmessage': 'c',
+                          'messages': ['a', 'b', 'c']})
+        legacy_db.close()
+
+        store = SqliteUserStore(self.db_path, message_log_size=2)
+        self.assertEqual(1, migrate_tinydb_users(json_path, store))
+        self.assertEqual(['b', 'c'], store.get('SomeNick')['messages'])
+        self.assertFalse(os.path.exists(json_path))
+
+        # Second run is a no-op
+        self.assertEqual(0, migrate_tinydb_users(json_path, store))
+        store.close()
+
+
+class MessageArchiveTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.expired = []
+        self.archive = MessageArchive(
+            os.path.join(self.tmp_dir.name, 'archive'), segment_size=2,
+            max_messages=4, on_expire=self.expired.append)
+        self.store = SqliteUserStore(
+            os.path.join(self.tmp_dir.name, 'users.sqlite3'),
+            message_log_size=3, archive=self.archive)
+
+    def tearDown(self) -> None:
+        self.store.close()
+        self.tmp_dir.cleanup()
+
+    def test_roll_into_archive(self) -> None:
+        messages = [f'msg {i}' for i in range(6)]
+        for i, message in enumerate(messages[:4]):
+            self.store.add_message('Some/Nick', message, float(i))
+        # Not a whole segment past the log yet
+        self.assertEqual(0, self.archive.message_count('Some/Nick'))
+        self.assertEqual(messages[1:4], self.store.get('Some/Nick')['messages'])
+
+        self.store.add_messages('Some/Nick', messages[4:], 5.0)
+        self.assertEqual(2, self.archive.message_count('Some/Nick'))
+        self.assertEqual(messages[3:], self.store.get('Some/Nick')['messages'])
+        self.assertEqual(messages, list(self.store.iter_messages('Some/Nick')))
+        self.assertEqual([], list(self.store.iter_messages('OtherNick')))
+
+    def test_expire(self) -> None:
+        messages = [f'msg {i}' for i in range(7)]
+        self.store.add_messages('SomeNick', messages, 1.0)
+        self.assertEqual([], self.expired)
+        self.store.add_messages('SomeNick', ['a', 'b'], 2.0)
+        self.assertEqual(['SomeNick'], self.expired)
+        # The oldest segment is gone, 4 messages archived and 3 in the log
+        self.assertEqual(7, self.store.history_size)
+        self.assertEqual(messages[2:] + ['a', 'b'],
+                         list(self.store.iter_messages('SomeNick')))
+
+    def test_write_behind(self) -> None:
+        store = WriteBehindUserStore(self.store, flush_interval=3600,
+                                     flush_size=1000)
+        for i in range(6):
+            store.add_message('SomeNick', f'msg {i}', float(i))
+        self.assertEqual(['msg 3', 'msg 4', 'msg 5'],
+                         store.get('SomeNick')['messages'])
+        # All of them pending, then all of them in the log and archive
+        expected = [f'msg {i}' for i in range(6)]
+        self.assertEqual(expected, list(store.iter_messages('SomeNick')))
+        store.flush()
+        self.assertEqual(expected, list(store.iter_messages('SomeNick')))
+
+
+class WriteBehindUserStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = SqliteUserStore(
+            os.path.join(self.tmp_dir.name, 'users.sqlite3'),
+            message_log_size=3)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_reads_see_pending_updates(self) -> None:
+        self.backend.add_message('SomeNick', 'stored', 1.0)
+        store = WriteBehindUserStore(self.backend, flush_interval=3600,
+                                     flush_size=1000)
+        for i in range(3):
+            store.add_message('SomeNick', f'msg {i}', 2.0 + i)
+        store.add_message('OtherNick', 'hi', 5.0)
+
+        # Nothing written yet
+        self.assertEqual(['stored'], self.backend.get('SomeNick')['messages'])
+        self.assertEqual(['msg 0', 'msg 1', 'msg 2'],
+                         store.get('SomeNick')['messages'])
+        self.assertEqual(['SomeNick', 'OtherNick'], store.names())
+
+        store.flush()
+        self.assertEqual(['msg 0', 'msg 1', 'msg 2'],
+                         self.backend.get('SomeNick')['messages'])
+        self.assertEqual('hi', self.backend.get('OtherNick')['lastmessage'])
+        store.close()
+
+    def test_flush_on_size_budget(self) -> None:
+        store = WriteBehindUserStore(self.backend, flush_interval=3600,
+                                     flush_size=2)
+        store.add_message('SomeNick', 'a', 1.0)
+        store.add_message('SomeNick', 'b', 2.0)
+        for _ in range(100):
+            if self.backend.get('SomeNick'):
+                break
+            time.sleep(0.01)
+        self.assertEqual(['a', 'b'], self.backend.get('SomeNick')['messages'])
+        store.close()
+
+    def test_failed_flush_is_kept(self) -> None:
+        store = WriteBehindUserStore(self.backend, flush_interval=3600,
+                                     flush_size=1000)
+        store.add_message('SomeNick', 'a', 1.0)
+        store.add_message('OtherNick', 'b', 2.0)
+        add_messages = self.backend.add_messages
+
+        def fail_other(name: str, *args: Any) -> None:
+            if name == 'OtherNick':
+                raise sqlite3.OperationalError('database is locked')
+            add_messages(name, *args)
+
+        with mock.patch.object(self.backend, 'add_messages',
+                               side_effect=fail_other):
+            with self.assertRaises(sqlite3.OperationalError):
+                store.flush()
+        store.add_message('OtherNick', 'c', 3.0)
+        self.assertEqual(['b', 'c'], store.get('OtherNick')['messages'])
+
+        store.flush()
+        # Written once each
+        self.assertEqual(['a'], self.backend.get('SomeNick')['messages'])
+        self.assertEqual(['b', 'c'], self.backend.get('OtherNick')['messages'])
+        self.assertEqual(3.0, self.backend.get('OtherNick')['lastseen'])
+        store.close()
+
+
+class MessageLogTest(unittest.TestCase):
+
+    def test_ring(self) -> None:
+        log = MessageLog(8)
+        self.assertEqual([], list(log))
+        expected = []
+        for i in range(50):
+            message = f'msg {i} ä' * (i % 3)
+            log.append(message)
+            expected = (expected + [message])[-8:]
+            self.assertEqual(expected, list(log))
+            self.assertEqual(len(expected), len(log))
+        self.assertEqual(['a'], list(MessageLog(1, ['x', 'y', 'a'])))
+
+
+class ResidentUserStoreTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.backend = SqliteUserStore(
+            os.path.join(self.tmp_dir.name, 'users.sqlite3'),
+            message_log_size=3)
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_resident_after_read(self) -> None:
+        store = ResidentUserStore(self.backend, max_users=1)
+        store.add_message('SomeNick', 'a', 1.0)
+        store.add_message('OtherNick', 'b', 2.0)
+        self.assertEqual(['a'], store.get('SomeNick')['messages'])
+        self.assertEqual(1, store.memory_usage()['users'])
+
+        # Kept up to date in memory and passed on to the backend
+        for message in ['c', 'd', 'e']:
+            store.add_message('SomeNick', message, 3.0)
+        with mock.patch.object(self.backend, 'get') as backend_get:
+            user = store.get('SomeNick')
+        backend_get.assert_not_called()
+        self.assertEqual(self.backend.get('SomeNick'), user)
+        self.assertEqual(['c', 'd', 'e'], user['messages'])
+
+        # Only one user is kept
+        self.assertEqual('b', store.get('OtherNick')['lastmessage'])
+        self.assertEqual(1, store.memory_usage()['users'])
+        self.assertEqual(['c', 'd', 'e'], store.get('SomeNick')['messages'])
+        self.assertIsNone(store.get('NoNick'))
+        store.close()
+
+    def test_add_during_load(self) -> None:
+        store = ResidentUserStore(self.backend, max_users=4)
+        store.add_message('SomeNick', 'a', 1.0)
+        backend_get = self.backend.get
+        messages = [('SomeNick', 'b', 2.0)]
+
+        def slow_get(name: str) -> Optional[Dict]:
+            # Writers go on while the backend is read
+            if messages:
+                writer = threading.Thread(target=store.add_message,
+                                          args=messages.pop())
+                writer.start()
+                writer.join(timeout=5)
+                self.assertFalse(writer.is_alive())
+            return backend_get(name)
+
+        with mock.patch.object(self.backend, 'get',
+                               side_effect=slow_get) as patched_get:
+            self.assertEqual(['a', 'b'], store.get('SomeNick')['messages'])
+        # Read again, the first read may have missed the message
+        self.assertEqual(2, patched_get.call_count)
+        store.add_message('SomeNick', 'c', 3.0)
+        self.assertEqual(self.backend.get('SomeNick'), store.get('SomeNick'))
+        store.close()
+
+
+class UserIndexTest(unittest.TestCase):
+
+    def test_find(self) -> None:
+        index = UserIndex(['SomeNick', 'someone', 'OtherNick'])
+        index.add('SOMENICK')
+
+        self.assertEqual(3, len(index))
+        self.assertEqual('SomeNick', index.find('somenick'))
+        self.assertEqual('OtherNick', index.find('oth'))
+        self.assertIsNone(index.find('oth', prefix=False))
+        self.assertEqual('someone', index.find('sommeone', fuzzy=True))
+        # Queries are not regexes
+        self.assertIsNone(index.find('.*'))
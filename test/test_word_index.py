@@ -0,0 +1,107 @@
+import threading
+import unittest
+from typing import Iterator, List
+
+from sklearn.feature_extraction.text import CountVectorizer
+
+from src.util import STOPWORDS, Stopwords
+from src.wordindex import WordFrequencyIndex
+
+
+class WordFrequencyIndexTest(unittest.TestCase):
+    messages = ["I use Arch btw, arch is great",
+                "Gentoo users compile everything, arch users don't",
+                "Debian is stable and debian is old",
+                "héllo wörld, héllo again",
+                "x y z arch arch"]
+
+    @staticmethod
+    def count_vectorizer_counts(msgs: List[str]) -> dict:
+        cv = CountVectorizer(stop_words=list(STOPWORDS))
+        bow = cv.fit_transform([m.lower() for m in msgs])
+        sums = bow.sum(axis=0)
+        return {word: sums[0, index] for word, index in cv.vocabulary_.items()}
+
+    def test_counts_match_count_vectorizer(self) -> None:
+        log: List[str] = []
+        index = WordFrequencyIndex(3, lambda name: list(log))
+        log.extend(self.messages[:2])
+        # Materialize, then keep adding past the log size
+        index.top_words('SomeNick', 10, STOPWORDS)
+        for message in self.messages[2:]:
+            log.append(message)
+            index.add_message('SomeNick', message)
+
+        expected = self.count_vectorizer_counts(log[-3:])
+        top = index.top_words('SomeNick', 100, STOPWORDS)
+        self.assertEqual(expected, dict(top))
+        self.assertEqual(2, top[0][1])
+
+    def test_archived(self) -> None:
+        log: List[str] = list(self.messages[:2])
+        index = WordFrequencyIndex(1, lambda name: iter(log), archived=True)
+        index.top_words('SomeNick', 10, STOPWORDS)
+        for message in self.messages[2:]:
+            log.append(message)
+            index.add_message('SomeNick', message)
+        # Nothing falls off the counts until the user is recounted
+        top = index.top_words('SomeNick', 100, STOPWORDS)
+        self.assertEqual(self.count_vectorizer_counts(log), dict(top))
+
+        del log[:3]
+        index.invalidate('SomeNick')
+        top = index.top_words('SomeNick', 100, STOPWORDS)
+        self.assertEqual(self.count_vectorizer_counts(log), dict(top))
+
+    def test_add_during_load(self) -> None:
+        log = ['arch gentoo']
+        loads: List[str] = []
+
+        def add(name: str, message: str) -> None:
+            # As the bot does for each message
+            with index.lock:
+                log.append(message)
+                index.add_message(name, message)
+
+        def load(name: str) -> Iterator[str]:
+            loads.append(name)
+            if len(loads) == 1:
+                # Messages go on while a user is loaded
+                for nick in ('OtherNick', 'SomeNick'):
+                    writer = threading.Thread(target=add,
+                                              args=(nick, 'arch'))
+                    writer.start()
+                    writer.join(timeout=5)
+                    self.assertFalse(writer.is_alive())
+            return iter(list(log))
+
+        index = WordFrequencyIndex(10, load, archived=True)
+        # The first load may have missed the message, so loaded again
+        self.assertEqual([('arch', 3), ('gentoo', 1)],
+                         index.top_words('SomeNick', 10, ()))
+        self.assertEqual(2, len(loads))
+
+        # And kept up to date from then on
+        add('SomeNick', 'arch')
+        self.assertEqual([('arch', 4), ('gentoo', 1)],
+                         index.top_words('SomeNick', 10, ()))
+        self.assertEqual(2, len(loads))
+
+    def test_untracked_user(self) -> None:
+        index = WordFrequencyIndex(3, lambda name: [])
+        index.add_message('SomeNick', 'hello world')
+        self.assertEqual([], index.top_words('OtherNick', 10, STOPWORDS))
+
+
+class StopwordsTest(unittest.TestCase):
+    def test_overlay(self) -> None:
+        size = len(STOPWORDS)
+        stopwords = Stopwords(STOPWORDS, ['somenick', 'the'])
+        self.assertIn('somenick', stopwords)
+        self.assertIn('the', stopwords)
+        self.assertNotIn('arch', stopwords)
+        self.assertEqual(size + 1, len(stopwords))
+        self.assertEqual(STOPWORDS | {'somenick'}, set(stopwords))
+        # The base is left alone
+        self.assertEqual(size, len(STOPWORDS))
+        self.assertNotIn('somenick', STOPWORDS)
@@ -0,0 +1,220 @@
+import os
+import queue
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Tuple
+from unittest import mock
+
+from src import wordcloudrenderer
+from src.wordclouddrawing import draw_wordcloud, load_mask
+from src.wordcloudrenderer import DEFAULT_MASK, JOB_CACHED, JOB_DUPLICATE, \
+    JOB_QUEUE_FULL, JOB_STARTED, LinkCache, WordCloudRenderer, find_mask
+
+
+class WordCloudRendererTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.release = threading.Event()
+        self.results: List[Tuple[Optional[str], Optional[BaseException]]] = []
+        self.done = threading.Semaphore(0)
+        self.renders = 0
+
+        def fake_render(name: str, *args) -> str:
+            self.renders += 1
+            self.release.wait(5)
+            return "https://i.imgur.com/" + name + ".png"
+
+        patcher = mock.patch('src.wordcloudrenderer.render_wordcloud',
+                             fake_render)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_renderer(self, max_jobs: int, timeout: float) -> WordCloudRenderer:
+        renderer = WordCloudRenderer(max_workers=2, max_jobs=max_jobs,
+                                     timeout=timeout)
+        # Threads instead of processes, the fake render is not picklable
+        renderer._executor = ThreadPoolExecutor(2)
+        self.addCleanup(renderer.shutdown)
+        return renderer
+
+    def on_done(self, link: Optional[str],
+                error: Optional[BaseException]) -> None:
+        self.results.append((link, error))
+        self.done.release()
+
+    def test_duplicate_and_queue_full(self) -> None:
+        renderer = self.make_renderer(max_jobs=2, timeout=10)
+        self.assertEqual(JOB_STARTED, renderer.submit(
+            "Nick", "text", set(), False, DEFAULT_MASK, self.on_done))
+        self.assertEqual(JOB_DUPLICATE, renderer.submit(
+            "nick", "text", set(), False, DEFAULT_MASK, self.on_done))
+        self.assertEqual(JOB_STARTED, renderer.submit(
+            "other", "text", set(), False, DEFAULT_MASK, self.on_done))
+        self.assertEqual(JOB_QUEUE_FULL, renderer.submit(
+            "third", "text", set(), False, DEFAULT_MASK, self.on_done))
+
+        self.release.set()
+        self.assertTrue(self.done.acquire(timeout=5))
+        self.assertTrue(self.done.acquire(timeout=5))
+        self.assertCountEqual([("https://i.imgur.com/Nick.png", None),
+                               ("https://i.imgur.com/other.png", None)],
+                              self.results)
+        # Slots are free again
+        self.assertEqual(JOB_STARTED, renderer.submit(
+            "Nick", "new text", set(), False, DEFAULT_MASK, self.on_done))
+        self.assertTrue(self.done.acquire(timeout=5))
+
+    def test_cached_link(self) -> None:
+        renderer = self.make_renderer(max_jobs=2, timeout=10)
+        self.release.set()
+        renderer.submit("Nick", "text", set(), True, DEFAULT_MASK,
+                        self.on_done)
+        self.assertTrue(self.done.acquire(timeout=5))
+
+        self.assertEqual(JOB_CACHED, renderer.submit(
+            "nick", "text", set(), True, DEFAULT_MASK, self.on_done))
+        self.assertTrue(self.done.acquire(timeout=0))
+        self.assertEqual(("https://i.imgur.com/Nick.png", None),
+                         self.results[-1])
+        self.assertEqual(1, self.renders)
+
+        # New messages or another title flag mean a new cloud
+        self.assertEqual(JOB_STARTED, renderer.submit(
+            "Nick", "text more", set(), True, DEFAULT_MASK, self.on_done))
+        self.assertTrue(self.done.acquire(timeout=5))
+        self.assertEqual(JOB_STARTED, renderer.submit(
+            "Nick", "text", set(), False, DEFAULT_MASK, self.on_done))
+        self.assertTrue(self.done.acquire(timeout=5))
+        self.assertEqual(3, self.renders)
+
+    def test_timeout(self) -> None:
+        renderer = self.make_renderer(max_jobs=2, timeout=0.05)
+        renderer.submit("Nick", "text", set(), False, DEFAULT_MASK,
+                        self.on_done)
+        self.assertTrue(self.done.acquire(timeout=5))
+        link, error = self.results[0]
+        self.assertIsNone(link)
+        self.assertIsInstance(error, TimeoutError)
+        self.release.set()
+        # The late result is not reported a second time
+        self.assertFalse(self.done.acquire(timeout=0.2))
+
+
+def quick_render(name: str, *args: Any) -> str:
+    return "https://i.imgur.com/" + name + ".png"
+
+
+def hung_render(name: str, *args: Any) -> str:
+    time.sleep(60)
+    return ""
+
+
+class WorkerFailureTest(unittest.TestCase):
+    """
+    With real worker processes, the renders are module level functions
+    the workers import.
+    """
+
+    def setUp(self) -> None:
+        # (link, error) of each finished job
+        self.results: queue.Queue = queue.Queue()
+        self.renderer = WordCloudRenderer(max_workers=1, max_jobs=2,
+                                          timeout=1)
+        self.addCleanup(self.renderer.shutdown)
+
+    def submit(self, name: str, render: Callable) -> str:
+        with mock.patch('src.wordcloudrenderer.render_wordcloud', render):
+            return self.renderer.submit(
+                name, "text", set(), False, DEFAULT_MASK,
+                lambda link, error: self.results.put((link, error)))
+
+    def test_dead_worker(self) -> None:
+        self.assertEqual(JOB_STARTED, self.submit("Nick", hung_render))
+        for process in list(self.renderer._executor._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+        link, error = self.results.get(timeout=10)
+        self.assertIsInstance(error, BrokenProcessPool)
+
+        self.assertEqual(JOB_STARTED, self.submit("Other", quick_render))
+        self.assertEqual(("https://i.imgur.com/Other.png", None),
+                         self.results.get(timeout=30))
+
+    def test_hung_worker(self) -> None:
+        self.assertEqual(JOB_STARTED, self.submit("Nick", hung_render))
+        link, error = self.results.get(timeout=10)
+        self.assertIsInstance(error, TimeoutError)
+
+        # Not stuck behind the hung render
+        self.assertEqual(JOB_STARTED, self.submit("Other", quick_render))
+        self.assertEqual(("https://i.imgur.com/Other.png", None),
+                         self.results.get(timeout=30))
+
+
+class LinkCacheTest(unittest.TestCase):
+    def test_ttl_and_size(self) -> None:
+        now = [0.0]
+        cache = LinkCache(2, 10, clock=lambda: now[0])
+        cache.put('a', "link a")
+        cache.put('b', "link b")
+        self.assertEqual("link a", cache.get('a'))
+        cache.put('c', "link c")
+        # b was used least recently
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual("link a", cache.get('a'))
+        now[0] = 10
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNone(cache.get('c'))
+
+
+class DrawWordCloudTest(unittest.TestCase):
+    text = "arch gentoo debian arch btw kernel arch linux " * 10
+
+    def test_title_band(self) -> None:
+        plain = draw_wordcloud("SomeNick", self.text, set(), False,
+                               DEFAULT_MASK)
+        titled = draw_wordcloud("SomeNick", self.text, set(), True,
+                                DEFAULT_MASK)
+        self.assertEqual(plain.width, titled.width)
+        self.assertGreater(titled.height, plain.height)
+        # The band above the cloud holds the title
+        band = titled.crop((0, 0, titled.width,
+                            titled.height - plain.height))
+        darkest, _ = band.convert("L").getextrema()
+        self.assertLess(darkest, 128)
+
+
+class MaskTest(unittest.TestCase):
+    def test_load_once(self) -> None:
+        mask = load_mask(DEFAULT_MASK)
+        self.assertIs(mask, load_mask(DEFAULT_MASK))
+        self.assertFalse(mask.array.flags.writeable)
+
+    def test_reload_on_change(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "mask.png"
+            shutil.copy(DEFAULT_MASK, path)
+            mask = load_mask(path)
+            os.utime(path, ns=(0, 0))
+            self.assertIsNot(mask, load_mask(path))
+
+    def test_find_mask(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(wordcloudrenderer, 'MASKS_PATH', Path(tmp)):
+            self.assertEqual(DEFAULT_MASK, find_mask("Nick", "#linux"))
+            (Path(tmp) / "linux.png").touch()
+            self.assertEqual(Path(tmp) / "linux.png",
+                             find_mask("Nick", "#linux"))
+            (Path(tmp) / "nick.png").touch()
+            self.assertEqual(Path(tmp) / "nick.png",
+                             find_mask("Nick", "#linux"))
+            self.assertEqual(DEFAULT_MASK, find_mask("Other", "#a/../linux"))
+
+
+if __name__ == '__main__':
+    unittest.main()
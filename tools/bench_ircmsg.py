@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of IRC line handling: the old find() classification with
+the old PRIVMSG splitting against parse_line with a dict lookup on the
+command.
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.ircmsg import IrcMsg, Message, parse_line  # noqa: E402
+
+LINES = [
+    ":SomeNick!SomeNick@snoonet.org/user/SomeNick PRIVMSG #linuxmasterrace "
+    ":I use Arch btw, and you should too",
+    "@time=2021-03-01T12:00:00.000Z;account=SomeNick "
+    ":SomeNick!SomeNick@snoonet.org/user/SomeNick PRIVMSG #linuxmasterrace "
+    ":\\wordcloud OtherNick title",
+    ":OtherNick!Other@snoonet.org/user/OtherNick JOIN #linuxmasterrace",
+    "PING :irc.snoonet.org",
+    ":irc.snoonet.org NOTICE * :*** Looking up your hostname...",
+    ":NickServ!NickServ@services.snoonet.org NOTICE bot "
+    ":You are now logged in as bot.",
+]
+
+
+def old_from_raw(raw: str) -> Optional[IrcMsg]:
+    # IrcMsg.from_raw before parse_line replaced it
+    name = raw.split('!', 1)[0][1:]
+    channel = raw.split('PRIVMSG', 1)[1].split()[0]
+    try:
+        msg = raw.split('PRIVMSG', 1)[1].split(':', 1)[1]
+    except IndexError:
+        return None
+    return IrcMsg(name, channel, msg)
+
+
+def old_dispatch(line: str) -> Optional[object]:
+    if line.find("PRIVMSG") != -1:
+        return old_from_raw(line)
+    elif line.find("ERROR") != -1:
+        return line
+    elif line.find("JOIN") != -1:
+        return line.split(maxsplit=1)[0]
+    elif line.find("PING :") != -1:
+        return line[line.rindex('PING') + len('PING :'):]
+    return None
+
+
+HANDLERS: Dict[str, Callable[[Message], object]] = {
+    'PRIVMSG': IrcMsg.from_message,
+    'ERROR': lambda m: m.trailing,
+    'JOIN': lambda m: m.nick,
+    'PING': lambda m: m.trailing,
+}
+
+
+def new_dispatch(line: str) -> Optional[object]:
+    message = parse_line(line)
+    if message is None:
+        return None
+    handler = HANDLERS.get(message.command)
+    return handler(message) if handler is not None else None
+
+
+def bench(name: str, dispatch: Callable[[str], object], lines: List[str],
+          number: int, repeat: int) -> None:
+    timer = timeit.Timer(lambda: [dispatch(line) for line in lines])
+    best = min(timer.repeat(repeat=repeat, number=number))
+    per_line_us = best / (number * len(lines)) * 1e6
+    print(f"{name:>14}: {per_line_us:6.2f} us/line")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    bench("find+from_raw", old_dispatch, LINES, args.number, args.repeat)
+    bench("parse_line", new_dispatch, LINES, args.number, args.repeat)
+    bench("parse_line only", parse_line, LINES, args.number, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Import time report for the bot, from python -X importtime.
+
+Prints the slowest imports of `import src.ircbot` and fails if one of the
+heavy libraries that commands load on first use is imported at startup,
+or if startup imports take longer than --budget milliseconds.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, NamedTuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Loaded by commands on first use, never at startup
+HEAVY_MODULES = ('copypasta_search', 'imgurpython', 'matplotlib', 'nltk',
+                 'numpy', 'PIL', 'praw', 'scipy', 'sklearn', 'textblob',
+                 'vaderSentiment', 'wordcloud')
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def measure(module: str) -> List[ImportTime]:
+    env = dict(os.environ, CI=os.environ.get('CI', '1'))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times.append(ImportTime(name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--module', default='src.ircbot')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--budget', type=float, default=None,
+                        help="fail above this many milliseconds")
+    args = parser.parse_args()
+
+    times = measure(args.module)
+    total_ms = sum(t.self_us for t in times) / 1000
+    print(f"{len(times)} modules imported in {total_ms:.1f} ms")
+    print(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+    for t in sorted(times, key=lambda t: t.cumulative_us,
+                    reverse=True)[:args.top]:
+        print(f"{t.self_us / 1000:10.1f} {t.cumulative_us / 1000:16.1f}  "
+              f"{t.module}")
+
+    failed = False
+    heavy = sorted({t.module for t in times
+                    if t.module.split('.')[0] in HEAVY_MODULES})
+    if heavy:
+        print("Heavy modules imported at startup: " + ', '.join(heavy))
+        failed = True
+    if args.budget is not None and total_ms > args.budget:
+        print(f"Startup imports over budget: {total_ms:.1f} ms > "
+              f"{args.budget:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Memory needed per user for the message log, as a list of str and as the
+resident MessageLog, at a given USER_DB_MESSAGE_LOG_SIZE.
+
+Uses the messages of the users in a SQLite user db if one is given,
+synthetic messages otherwise.
+"""
+import argparse
+import random
+import sqlite3
+import string
+import sys
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.userstore.residentuserstore import MessageLog  # noqa: E402
+
+
+def list_nbytes(messages: List[str]) -> int:
+    return sys.getsizeof(messages) + sum(map(sys.getsizeof, messages))
+
+
+def synthetic_users(count: int, log_size: int,
+                    message_length: int) -> List[List[str]]:
+    rng = random.Random(0)
+    alphabet = string.ascii_lowercase + ' ' * 6
+    return [[''.join(rng.choices(alphabet,
+                                 k=rng.randint(1, 2 * message_length)))
+             for _ in range(log_size)] for _ in range(count)]
+
+
+def db_users(path: str, count: int) -> List[List[str]]:
+    connection = sqlite3.connect(path)
+    user_ids = [row[0] for row in connection.execute(
+        'SELECT id FROM users LIMIT ?', (count,))]
+    users = [[row[0] for row in connection.execute(
+        'SELECT message FROM messages WHERE user_id = ? ORDER BY id',
+        (user_id,))] for user_id in user_ids]
+    connection.close()
+    return users
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--log-size', type=int, default=1000,
+                        help="USER_DB_MESSAGE_LOG_SIZE")
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--message-length', type=int, default=60,
+                        help="mean length of synthetic messages")
+    parser.add_argument('--db', help="SQLite user db to take messages from")
+    args = parser.parse_args()
+
+    if args.db:
+        users = db_users(args.db, args.users)
+    else:
+        users = synthetic_users(args.users, args.log_size,
+                                args.message_length)
+    users = [messages[-args.log_size:] for messages in users if messages]
+    if not users:
+        print("No users")
+        return
+
+    as_list = [list_nbytes(messages) for messages in users]
+    as_log = [MessageLog(args.log_size, messages).nbytes
+              for messages in users]
+    # Just before the messages that fell off are cut off
+    as_log_full = [MessageLog(args.log_size,
+                              messages + messages[:args.log_size - 1]).nbytes
+                   for messages in users]
+    payload = [sum(len(m.encode()) for m in messages) for messages in users]
+    count = len(users)
+    print(f"{count} users, log size {args.log_size}, "
+          f"{sum(map(len, users)) / count:.0f} messages per user")
+    print(f"{'':>12} {'bytes/user':>12} {'x payload':>10}")
+    for name, sizes in (('UTF-8 text', payload), ('list of str', as_list),
+                        ('MessageLog', as_log),
+                        ('at most', as_log_full)):
+        print(f"{name:>12} {sum(sizes) / count:12.0f} "
+              f"{sum(sizes) / sum(payload):10.2f}")
+
+
+if __name__ == '__main__':
+    main()